@@ -1,13 +1,100 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
 from .models import User, Restaurant, MenuItem, CartItem, Order, OrderItem, Product
 
-# Register your models here.
-admin.site.register(Restaurant)
-admin.site.register(MenuItem)
-admin.site.register(CartItem)
-admin.site.register(Order)
-admin.site.register(OrderItem)
+
+def estimated_count(queryset):
+    """Row count from the PostgreSQL planner (``EXPLAIN``), without scanning the table."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that trusts the planner's estimate for large result sets.
+
+    An exact ``COUNT(*)`` over millions of rows reads the whole table or
+    index on every change-list page. Above ``ADMIN_ESTIMATED_COUNT_THRESHOLD``
+    the estimate is used instead; smaller (usually filtered) lists still get
+    an exact count.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = estimated_count(queryset)
+            if estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Без второго COUNT(*) по всей таблице ради "N total" при фильтрации
+    show_full_result_count = False
+
+
+@admin.register(Restaurant)
+class RestaurantAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+
+@admin.register(MenuItem)
+class MenuItemAdmin(LargeTableAdmin):
+    list_display = ('name', 'restaurant', 'price')
+    list_select_related = ('restaurant',)
+    search_fields = ('name',)
+    autocomplete_fields = ('restaurant',)
+
+
+@admin.register(CartItem)
+class CartItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'menu_item', 'quantity', 'created_at')
+    list_select_related = ('user', 'menu_item')
+    raw_id_fields = ('user', 'menu_item')
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    raw_id_fields = ('menu_item',)
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('menu_item')
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'restaurant', 'status', 'total_price', 'drone_id', 'created_at')
+    list_select_related = ('user', 'restaurant')
+    # status и created_at покрыты индексами order_status_geohash_idx и order_created_idx
+    list_filter = ('status', 'created_at')
+    ordering = ('-created_at', '-id')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('restaurant',)
+    inlines = (OrderItemInline,)
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'order_id', 'menu_item', 'quantity', 'price_at_time')
+    list_select_related = ('menu_item',)
+    raw_id_fields = ('order', 'menu_item')
+
+
 admin.site.register(Product)
 
 @admin.register(User)
@@ -0,0 +1,179 @@
+"""Read-only JSON catalog API for the mobile client.
+
+``/api/restaurants/``, ``/api/restaurants/<id>/menu/`` and ``/api/products/``
+return ``{"results": [...], "next_after": id}`` pages ordered by ``id``:
+``?after=<id>`` continues from the last row (keyset, no OFFSET),
+``?limit=`` sets the page size and ``?fields=id,name`` trims each row.
+
+The ETag of a page is derived from the query parameters and the catalog
+version (see ``catalog.py``) the rendered rows were built for, so a stale
+entry served during another process's rebuild keeps its old ETag. When the
+client already holds the current version, ``If-None-Match`` is answered with
+``304`` before any data is loaded. Rendered current-version bodies are kept in
+the per-process cache under their ETag. Products are not kept in the catalog
+cache; their pages use the ``PRODUCTS`` version read before the query.
+"""
+import hashlib
+import json
+from bisect import bisect_right
+from typing import Callable, NamedTuple
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+
+from . import catalog
+from .models import Product
+
+
+def _file_url(field):
+    return field.url if field else None
+
+
+class Resource(NamedTuple):
+    fields: dict  # имя поля в ответе -> функция от объекта
+    scope: Callable  # (**kwargs) -> область версии каталога
+    rows: Callable  # (after, limit, **kwargs) -> (до limit + 1 объектов с id > after, версия данных)
+    private: bool = False  # только для вошедших пользователей
+
+
+def _slice(objects, after, limit):
+    # Кэшированные списки каталога уже отсортированы по id
+    start = bisect_right(objects, after, key=lambda obj: obj.id)
+    return objects[start:start + limit + 1]
+
+
+def _restaurant_rows(after, limit):
+    restaurants, version = catalog.restaurants(with_version=True)
+    return _slice(restaurants, after, limit), version
+
+
+def _menu_rows(after, limit, restaurant_id):
+    menu, version = catalog.restaurant_menu(restaurant_id, with_version=True)
+    if menu is None:
+        raise Http404('Restaurant not found')
+    return _slice(menu[1], after, limit), version
+
+
+def _product_rows(after, limit):
+    # Версию читаем до запроса: покупка увеличивает её после коммита,
+    # так что строки могут быть только новее версии, и следующий запрос получит новый ETag
+    version = catalog.get_version(catalog.PRODUCTS)
+    return list(
+        Product.objects.filter(available=True, id__gt=after).order_by('id')[:limit + 1]
+    ), version
+
+
+RESOURCES = {
+    'restaurants': Resource(
+        fields={
+            'id': lambda r: r.id,
+            'name': lambda r: r.name,
+            'description': lambda r: r.description,
+            'logo': lambda r: _file_url(r.logo_path),
+        },
+        scope=lambda: catalog.RESTAURANTS,
+        rows=_restaurant_rows,
+    ),
+    'menu': Resource(
+        fields={
+            'id': lambda i: i.id,
+            'name': lambda i: i.name,
+            'description': lambda i: i.description,
+            'price': lambda i: i.price,
+            'image': lambda i: _file_url(i.image_path),
+            'restaurant_id': lambda i: i.restaurant_id,
+        },
+        scope=catalog.restaurant_scope,
+        rows=_menu_rows,
+    ),
+    'products': Resource(
+        fields={
+            'id': lambda p: p.id,
+            'name': lambda p: p.name,
+            'description': lambda p: p.description,
+            'price': lambda p: p.price,
+            'owner_id': lambda p: p.owner_id,
+            'created_at': lambda p: p.created_at.isoformat(),
+        },
+        scope=lambda: catalog.PRODUCTS,
+        rows=_product_rows,
+        private=True,
+    ),
+}
+
+
+class PageParams(NamedTuple):
+    after: int
+    limit: int
+    fields: tuple
+
+
+def parse_params(resource, query):
+    """Raises ``ValueError`` with a client-facing message on bad input."""
+    try:
+        after = int(query.get('after', 0))
+        limit = int(query.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('after and limit must be integers') from None
+    limit = max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+    fields = tuple(name for name in query.get('fields', '').split(',') if name) or tuple(resource.fields)
+    unknown = set(fields) - set(resource.fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return PageParams(after, limit, fields)
+
+
+def page_etag(name, kwargs, version, params):
+    key = f'{name}|{sorted(kwargs.items())}|{version}|{params.after}|{params.limit}|{",".join(params.fields)}'
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest()[:24])
+
+
+def render_page(resource_name, resource, params, kwargs):
+    """``(etag, body)`` of one page; the ETag describes exactly this body."""
+    rows, version = resource.rows(params.after, params.limit, **kwargs)
+    getters = [(name, resource.fields[name]) for name in params.fields]
+    results = [{name: get(obj) for name, get in getters} for obj in rows[:params.limit]]
+    next_after = rows[params.limit - 1].id if len(rows) > params.limit else None
+    body = json.dumps({'results': results, 'next_after': next_after},
+                      ensure_ascii=False, separators=(',', ':'))
+    return page_etag(resource_name, kwargs, version, params), body
+
+
+def catalog_view(request, resource_name, **kwargs):
+    resource = RESOURCES[resource_name]
+    if resource.private and not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    try:
+        params = parse_params(resource, request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Только номер версии из кэша: на 304 ни ORM, ни сериализация не нужны
+    etag = page_etag(resource_name, kwargs, catalog.get_version(resource.scope(**kwargs)), params)
+    client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in client_etags:
+        response = HttpResponseNotModified()
+    else:
+        cache_key = f'api:{etag}'
+        body = catalog.local_cache().get(cache_key)
+        if body is None:
+            try:
+                rendered_etag, body = render_page(resource_name, resource, params, kwargs)
+            except Http404 as e:
+                return JsonResponse({'error': str(e)}, status=404)
+            # Пока другой процесс пересобирает каталог, тело может быть от прежней версии:
+            # тогда у него свой ETag, и в кэш под текущим оно не попадает
+            if rendered_etag == etag:
+                catalog.local_cache().set(cache_key, body, timeout=settings.CATALOG_LOCAL_TTL)
+            etag = rendered_etag
+        # "*" проверяется только здесь: ресурс точно существует
+        if etag in client_etags or '*' in client_etags:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Клиент каждый раз переспрашивает, но с If-None-Match ответ — пустой 304
+    patch_cache_control(response, no_cache=True, **({'private': True} if resource.private else {'public': True}))
+    return response
@@ -0,0 +1,60 @@
+"""Cold storage for completed orders.
+
+Completed orders older than ``ORDER_ARCHIVE_AFTER_DAYS`` are copied with
+their items into ``ArchivedOrder``/``ArchivedOrderItem`` and deleted from the
+hot tables, one bounded batch per transaction. The hot ``Order`` table then
+holds only recent and active orders and stays small enough to be cached in
+memory. ``orders.order_history`` reads both sides and merges them.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ORDER_FIELDS = [f.attname for f in ArchivedOrder._meta.concrete_fields if f.name != 'archived_at']
+ITEM_FIELDS = [f.attname for f in ArchivedOrderItem._meta.concrete_fields]
+
+
+def archive_cutoff(now=None):
+    """Orders created before this moment may already be in the archive."""
+    return (now or timezone.now()) - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+
+
+def archive_batch(before, batch_size=None):
+    """Move up to ``batch_size`` completed orders created before ``before``; returns how many moved."""
+    batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH
+    with transaction.atomic():
+        # skip_locked: заказ, который сейчас меняют, уедет в следующий проход
+        ids = list(
+            Order.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=Order.OrderStatus.COMPLETED, created_at__lt=before)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        now = timezone.now()
+        ArchivedOrder.objects.bulk_create(
+            ArchivedOrder(archived_at=now, **row)
+            for row in Order.objects.filter(id__in=ids).values(*ORDER_FIELDS)
+        )
+        ArchivedOrderItem.objects.bulk_create(
+            (ArchivedOrderItem(**row) for row in OrderItem.objects.filter(order_id__in=ids).values(*ITEM_FIELDS)),
+            batch_size=5000,
+        )
+        OrderItem.objects.filter(order_id__in=ids).delete()
+        Order.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def archive(before=None, batch_size=None):
+    """Archive every eligible order, batch by batch; returns the total moved."""
+    before = before or archive_cutoff()
+    total = 0
+    while moved := archive_batch(before, batch_size):
+        total += moved
+    return total
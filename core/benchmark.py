@@ -0,0 +1,194 @@
+"""In-process benchmark of the ordering hot paths.
+
+Seeds a throwaway database, drives the views through the Django test client
+and records latency percentiles and SQL query counts per request. Each
+scenario has a budget; ``manage.py benchmark`` fails when one is exceeded and
+can write the results as JSON for comparison between runs.
+"""
+import random
+import statistics
+import time
+from typing import Callable, NamedTuple, Optional
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import geo, telemetry
+from .models import MenuItem, Order, OrderItem, Restaurant, User
+
+
+class Budget(NamedTuple):
+    p95_ms: float
+    queries: int
+
+
+class Scenario(NamedTuple):
+    name: str
+    request: Callable  # (client, data, rng) -> response
+    setup: Optional[Callable] = None  # (client, data, rng) перед каждым запросом, не входит в замер
+    prime: Optional[Callable] = None  # (client, data) один раз перед прогревом
+
+
+class Result(NamedTuple):
+    name: str
+    requests: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    queries: int
+    budget: Budget
+
+    @property
+    def failures(self):
+        failures = []
+        if self.p95_ms > self.budget.p95_ms:
+            failures.append(f'p95 {self.p95_ms:.1f} ms > {self.budget.p95_ms} ms')
+        if self.queries > self.budget.queries:
+            failures.append(f'{self.queries} queries > {self.budget.queries}')
+        return failures
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'p50_ms': round(self.p50_ms, 3),
+            'p95_ms': round(self.p95_ms, 3),
+            'p99_ms': round(self.p99_ms, 3),
+            'max_ms': round(self.max_ms, 3),
+            'queries': self.queries,
+            'budget': self.budget._asdict(),
+            'passed': not self.failures,
+        }
+
+
+# Запросы: сессия и пользователь входят в каждый авторизованный запрос
+BUDGETS = {
+    'menu': Budget(p95_ms=25, queries=2),
+    'add_to_cart': Budget(p95_ms=25, queries=3),
+    'checkout': Budget(p95_ms=40, queries=3),
+    'create_order': Budget(p95_ms=40, queries=8),
+    'orders': Budget(p95_ms=60, queries=4),
+    'positions': Budget(p95_ms=15, queries=0),
+}
+
+
+class Dataset(NamedTuple):
+    users: list
+    restaurant_ids: list
+    menu_item_ids: list
+
+
+def seed(scale=1.0, seed=0):
+    """Create users, restaurants, menus, order history and a reporting fleet."""
+    rng = random.Random(seed)
+    n_users = max(1, int(100 * scale))
+    n_restaurants = max(1, int(50 * scale))
+    items_per_restaurant = 20
+    orders_per_user = 50
+
+    User.objects.bulk_create(User(username=f'bench{i}') for i in range(n_users))
+    users = list(User.objects.filter(username__startswith='bench').order_by('id'))
+    Restaurant.objects.bulk_create(Restaurant(name=f'Restaurant {i}') for i in range(n_restaurants))
+    restaurant_ids = list(Restaurant.objects.order_by('id').values_list('id', flat=True))
+    MenuItem.objects.bulk_create(
+        MenuItem(name=f'Item {r}-{i}', price=round(rng.uniform(2, 30), 2), restaurant_id=r)
+        for r in restaurant_ids for i in range(items_per_restaurant)
+    )
+    menu = list(MenuItem.objects.values_list('id', 'restaurant_id', 'price'))
+    by_restaurant = {}
+    for item_id, restaurant_id, price in menu:
+        by_restaurant.setdefault(restaurant_id, []).append((item_id, price))
+
+    now = timezone.now()
+    orders = []
+    for user in users:
+        for n in range(orders_per_user):
+            lat, lon = 43.2 + rng.uniform(-0.1, 0.1), 76.9 + rng.uniform(-0.1, 0.1)
+            orders.append(Order(
+                user=user, restaurant_id=rng.choice(restaurant_ids), total_price=0,
+                delivery_latitude=lat, delivery_longitude=lon,
+                status=Order.OrderStatus.COMPLETED, created_at=now - timezone.timedelta(hours=n),
+                # bulk_create не вызывает save(), geohash считаем сами
+                geohash=geo.geohash_encode(lat, lon),
+            ))
+    Order.objects.bulk_create(orders, batch_size=2000)
+    lines = []
+    for order in Order.objects.only('id', 'restaurant_id').iterator(chunk_size=2000):
+        for item_id, price in rng.sample(by_restaurant[order.restaurant_id], 3):
+            lines.append(OrderItem(order_id=order.id, menu_item_id=item_id, quantity=1, price_at_time=price))
+    OrderItem.objects.bulk_create(lines, batch_size=5000)
+
+    telemetry.store.clear()
+    telemetry.store.ingest([
+        {'id': f'BENCH_{i:04d}', 'lat': 43.2 + rng.uniform(-0.2, 0.2), 'lon': 76.9 + rng.uniform(-0.2, 0.2),
+         'battery': rng.randint(20, 100), 'speed': 0}
+        for i in range(int(500 * scale) or 1)
+    ])
+    return Dataset(users, restaurant_ids, [item_id for item_id, _, _ in menu])
+
+
+def _visit_every_menu(client, data):
+    # Установившийся режим: каталог уже в кэше
+    for restaurant_id in data.restaurant_ids:
+        client.get(reverse('core:restaurant_menu', args=[restaurant_id]))
+
+
+def _add_random_item(client, data, rng):
+    client.post(reverse('core:add_to_cart'), {'menu_item_id': rng.choice(data.menu_item_ids), 'quantity': 1})
+
+
+SCENARIOS = [
+    Scenario('menu', lambda client, data, rng: client.get(
+        reverse('core:restaurant_menu', args=[rng.choice(data.restaurant_ids)])), prime=_visit_every_menu),
+    Scenario('add_to_cart', lambda client, data, rng: client.post(
+        reverse('core:add_to_cart'), {'menu_item_id': rng.choice(data.menu_item_ids), 'quantity': 1})),
+    Scenario('checkout', lambda client, data, rng: client.get(reverse('core:checkout')),
+             setup=_add_random_item),
+    Scenario('create_order', lambda client, data, rng: client.post(
+        reverse('core:create_order'), {'lat': 43.25, 'lon': 76.95}), setup=_add_random_item),
+    Scenario('orders', lambda client, data, rng: client.get(reverse('core:orders'))),
+    Scenario('positions', lambda client, data, rng: client.get(reverse('core:get_positions'))),
+]
+
+
+def percentile(sorted_values, q):
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    return statistics.quantiles(sorted_values, n=100, method='inclusive')[q - 1]
+
+
+def run_scenario(scenario, data, requests=200, warmup=20, seed=0, budgets=BUDGETS):
+    rng = random.Random(seed)
+    clients = []
+    for user in data.users[:10]:
+        client = Client()
+        client.force_login(user)
+        clients.append(client)
+
+    if scenario.prime:
+        scenario.prime(clients[0], data)
+    timings = []
+    queries = 0
+    for n in range(warmup + requests):
+        client = clients[n % len(clients)]
+        if scenario.setup:
+            scenario.setup(client, data, rng)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = scenario.request(client, data, rng)
+            elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f'{scenario.name}: HTTP {response.status_code}')
+        if n >= warmup:
+            timings.append(elapsed)
+            queries = max(queries, len(captured))
+
+    timings.sort()
+    return Result(
+        scenario.name, len(timings),
+        percentile(timings, 50), percentile(timings, 95), percentile(timings, 99), timings[-1],
+        queries, budgets[scenario.name],
+    )
@@ -0,0 +1,63 @@
+"""Cart reads and writes.
+
+Every write is a single statement, so a double-clicked "Add to cart" can not
+lose an update, and a cart is read together with its line subtotals and
+grand total in one query.
+"""
+from django.db import connections, router
+from django.db.models import ExpressionWrapper, F, FloatField, Sum, Window
+from django.utils import timezone
+
+from .models import CartItem, MenuItem
+
+
+def add_item(user, menu_item_id, quantity):
+    """Add ``quantity`` of a menu item, merging with an existing line.
+
+    Relies on the ``(user, menu_item)`` unique constraint: the insert turns
+    into an increment when the line exists. Returns False if the menu item
+    does not exist.
+    """
+    db = router.db_for_write(CartItem)
+    connection = connections[db]
+    qn = connection.ops.quote_name
+    cart_table = qn(CartItem._meta.db_table)
+    sql = (
+        f"INSERT INTO {cart_table} (user_id, menu_item_id, quantity, created_at) "
+        f"SELECT %s, id, %s, %s FROM {qn(MenuItem._meta.db_table)} WHERE id = %s "
+        f"ON CONFLICT (user_id, menu_item_id) "
+        f"DO UPDATE SET quantity = {cart_table}.quantity + excluded.quantity"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user.pk, quantity, timezone.now(), menu_item_id])
+        return cursor.rowcount > 0
+
+
+def update_item(user, cart_item_id, quantity):
+    return CartItem.objects.filter(id=cart_item_id, user=user).update(quantity=quantity) > 0
+
+
+def remove_item(user, cart_item_id):
+    deleted, _ = CartItem.objects.filter(id=cart_item_id, user=user).delete()
+    return deleted > 0
+
+
+def lines(user):
+    """Cart lines with ``subtotal`` and the whole cart's ``cart_total`` on each row."""
+    subtotal = ExpressionWrapper(F('menu_item__price') * F('quantity'), output_field=FloatField())
+    return (
+        CartItem.objects
+        .filter(user=user)
+        .select_related('menu_item__restaurant')
+        .annotate(
+            subtotal=subtotal,
+            cart_total=Window(Sum(subtotal)),
+        )
+        .order_by('id')
+    )
+
+
+def summary(user):
+    """``(lines, total)`` from a single query."""
+    items = list(lines(user))
+    return items, items[0].cart_total if items else 0
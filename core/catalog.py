@@ -0,0 +1,144 @@
+"""Versioned cache for the restaurant catalog.
+
+Menus change a few times a day and are read constantly, so query results
+are cached under keys that embed a version number. Saving or
+deleting a restaurant or menu item bumps the version (see ``signals.py``),
+which makes every old key unreachable instead of trying to delete them.
+Market products have a version too; it only feeds the ETags of ``api.py``.
+
+Two tiers are used: ``catalog_local`` is per-process memory, ``default`` is
+the shared backend. When an entry is missing or past its soft TTL only one
+process rebuilds it; the others keep serving the previous value. Rebuilds
+read from the primary database so a lagging replica can not be cached under
+the new version.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import routers
+from .models import MenuItem, Restaurant
+
+RESTAURANTS = 'restaurants'
+PRODUCTS = 'products'  # только версия для ETag API, товары не кэшируются
+LOCK_TIMEOUT = 30
+WAIT_STEPS = 20  # 20 x 50 мс ожидания, если старого значения нет
+
+
+def local_cache():
+    return caches['catalog_local']
+
+
+def shared_cache():
+    return caches['default']
+
+
+def restaurant_scope(restaurant_id):
+    return f'restaurant:{restaurant_id}'
+
+
+def _version_key(scope):
+    return f'catalog:version:{scope}'
+
+
+def get_version(scope):
+    key = _version_key(scope)
+    version = local_cache().get(key)
+    if version is None:
+        version = shared_cache().get(key)
+        if version is None:
+            # Начинаем с отметки времени, чтобы после вытеснения ключа не вернуться к старой версии
+            version = int(time.time() * 1000)
+            # Конечный TTL: запросы к несуществующим id не копят вечные ключи
+            if not shared_cache().add(key, version, timeout=settings.CATALOG_VERSION_KEY_TTL):
+                version = shared_cache().get(key, version)
+        local_cache().set(key, version, timeout=settings.CATALOG_VERSION_TTL)
+    return version
+
+
+def bump_version(scope):
+    key = _version_key(scope)
+    try:
+        version = shared_cache().incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        shared_cache().set(key, version, timeout=settings.CATALOG_VERSION_KEY_TTL)
+    local_cache().set(key, version, timeout=settings.CATALOG_VERSION_TTL)
+    return version
+
+
+def cached(name, scope, build):
+    """Return ``build()`` cached under ``name`` for the current ``scope`` version."""
+    return cached_with_version(name, scope, build)[0]
+
+
+def cached_with_version(name, scope, build):
+    """Like :func:`cached`, plus the version the returned value was built for.
+
+    During a rebuild by another process that is the previous version, so
+    callers deriving validators (``api.py`` ETags) never label a stale value
+    with the new version.
+    """
+    version = get_version(scope)
+    key = f'catalog:{name}:v{version}'
+    stale_key = f'catalog:{name}:latest'
+    now = time.time()
+
+    entry = local_cache().get(key)
+    if entry is None:
+        entry = shared_cache().get(key)
+        if entry is not None:
+            local_cache().set(key, entry, timeout=settings.CATALOG_LOCAL_TTL)
+    if entry is not None and entry[0] > now:
+        return entry[1], version
+
+    stale = entry or shared_cache().get(stale_key)
+    lock_key = f'{key}:lock'
+    locked = shared_cache().add(lock_key, 1, timeout=LOCK_TIMEOUT)
+    if not locked:
+        # Пересобирает другой процесс: отдаём прежнее значение или коротко ждём
+        if stale is not None:
+            # Записи без версии остались от прежнего формата: версия 0 никогда не совпадёт с текущей
+            return stale[1], stale[2] if len(stale) > 2 else 0
+        for _ in range(WAIT_STEPS):
+            time.sleep(0.05)
+            entry = shared_cache().get(key)
+            if entry is not None:
+                return entry[1], version
+
+    try:
+        # Сразу после смены версии реплика может ещё не видеть изменение
+        with routers.primary():
+            value = build()
+        entry = (time.time() + settings.CATALOG_TTL, value, version)
+        # Жёсткий TTL длиннее мягкого, чтобы было что отдать во время пересборки
+        shared_cache().set(key, entry, timeout=settings.CATALOG_TTL * 2)
+        shared_cache().set(stale_key, entry, timeout=settings.CATALOG_TTL * 2)
+        local_cache().set(key, entry, timeout=settings.CATALOG_LOCAL_TTL)
+    finally:
+        if locked:
+            shared_cache().delete(lock_key)
+    return value, version
+
+
+def restaurants(with_version=False):
+    """Restaurants ordered by id; ``(restaurants, version)`` with ``with_version``."""
+    result = cached_with_version(RESTAURANTS, RESTAURANTS, lambda: list(Restaurant.objects.order_by('id')))
+    return result if with_version else result[0]
+
+
+def restaurant_menu(restaurant_id, with_version=False):
+    """``(restaurant, menu_items)`` for ``restaurant_id``, or ``None`` if it does not exist.
+
+    With ``with_version`` returns ``(menu, version)`` as :func:`cached_with_version` does.
+    """
+    def build():
+        restaurant = Restaurant.objects.filter(id=restaurant_id).first()
+        if restaurant is None:
+            return None
+        return restaurant, list(MenuItem.objects.filter(restaurant_id=restaurant_id).order_by('id'))
+
+    scope = restaurant_scope(restaurant_id)
+    result = cached_with_version(scope, scope, build)
+    return result if with_version else result[0]
@@ -0,0 +1,7 @@
+from django.conf import settings
+
+
+def catalog(request):
+    # Срок жизни фрагментов {% cache %}: версия каталога уже в ключе,
+    # срок лишь не даёт записям прежних версий жить вечно
+    return {'catalog_ttl': settings.CATALOG_TTL}
@@ -0,0 +1,179 @@
+"""Assigning orders to the nearest available drones.
+
+Available drones are bucketed into a uniform lat/lon grid so a k-nearest
+query only inspects the cells around the destination. A batch of orders is
+matched as a whole: every order proposes its k nearest drones, the shortest
+proposals win first, and a swap pass then removes crossings that a greedy
+one-order-at-a-time dispatcher would leave behind.
+"""
+import heapq
+import math
+import threading
+from collections import defaultdict
+from typing import NamedTuple
+
+from django.conf import settings
+
+from . import telemetry
+from .geo import haversine
+
+METRES_PER_DEGREE = 111_320.0
+
+
+class Assignment(NamedTuple):
+    order_id: int
+    drone_id: str
+    distance: float  # метры
+
+
+class GridIndex:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size  # градусы
+        self.cells = defaultdict(dict)
+        self.positions = {}
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lon / self.cell_size))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def insert(self, key, lat, lon):
+        self.remove(key)
+        self.positions[key] = (lat, lon)
+        self.cells[self._cell(lat, lon)][key] = (lat, lon)
+
+    def remove(self, key):
+        position = self.positions.pop(key, None)
+        if position is not None:
+            cell = self._cell(*position)
+            del self.cells[cell][key]
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def _ring(self, row, col, radius):
+        if radius == 0:
+            yield row, col
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield row - radius, c
+            yield row + radius, c
+        for r in range(row - radius + 1, row + radius):
+            yield r, col - radius
+            yield r, col + radius
+
+    def nearest(self, lat, lon, k):
+        """Up to ``k`` ``(distance, key)`` pairs closest to the point, nearest first."""
+        if not self.positions:
+            return []
+        k = min(k, len(self.positions))
+        row, col = self._cell(lat, lon)
+        # Точки за пределами уже просмотренных колец не ближе этой величины
+        ring_metres = self.cell_size * METRES_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        best = []  # max-heap по расстоянию: (-distance, key)
+        seen = visited = 0
+        radius = 0
+        while True:
+            for cell in self._ring(row, col, radius):
+                visited += 1
+                bucket = self.cells.get(cell)
+                if not bucket:
+                    continue
+                for key, (plat, plon) in bucket.items():
+                    seen += 1
+                    distance = haversine(lat, lon, plat, plon)
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, key))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, key))
+            if len(best) == k and -best[0][0] <= radius * ring_metres:
+                break
+            if seen == len(self.positions):
+                break
+            if visited > 4 * len(self.cells) + 64:
+                # Разреженная сетка: пустых колец больше, чем точек — считаем всё подряд
+                return heapq.nsmallest(k, ((haversine(lat, lon, plat, plon), key)
+                                           for key, (plat, plon) in self.positions.items()))
+            radius += 1
+        return sorted((-d, key) for d, key in best)
+
+
+class Dispatcher:
+    def __init__(self, store, cell_size, candidates, min_battery):
+        self.store = store
+        self.cell_size = cell_size
+        self.candidates = candidates
+        self.min_battery = min_battery
+        self._lock = threading.Lock()
+
+    def available_index(self):
+        index = GridIndex(self.cell_size)
+        for drone in self.store.drones():
+            if drone.order_id is None and drone.battery >= self.min_battery:
+                index.insert(drone.drone_id, drone.lat, drone.lon)
+        return index
+
+    def match(self, index, orders):
+        """Match ``(order_id, lat, lon)`` tuples to drones in ``index``."""
+        positions = {order_id: (lat, lon) for order_id, lat, lon in orders}
+        assigned = {}  # order_id -> (distance, drone_id)
+        taken = set()
+        pending = list(positions)
+        k = self.candidates
+        while pending and len(taken) < len(index):
+            edges = []
+            for order_id in pending:
+                edges.extend((distance, order_id, drone_id)
+                             for distance, drone_id in index.nearest(*positions[order_id], k))
+            edges.sort()
+            for distance, order_id, drone_id in edges:
+                if order_id not in assigned and drone_id not in taken:
+                    assigned[order_id] = (distance, drone_id)
+                    taken.add(drone_id)
+            pending = [order_id for order_id in pending if order_id not in assigned]
+            if k >= len(index):
+                break
+            # Всем кандидатам досталось по заказу — расширяем круг
+            k *= 4
+
+        self._improve(index, positions, assigned)
+        return [Assignment(order_id, drone_id, distance)
+                for order_id, (distance, drone_id) in assigned.items()]
+
+    def _improve(self, index, positions, assigned, passes=3):
+        owner = {drone_id: order_id for order_id, (_, drone_id) in assigned.items()}
+        for _ in range(passes):
+            improved = False
+            for order_a in list(assigned):
+                distance_a, drone_a = assigned[order_a]
+                lat_a, lon_a = positions[order_a]
+                for _, drone_b in index.nearest(lat_a, lon_a, self.candidates):
+                    order_b = owner.get(drone_b)
+                    if order_b is None or order_b == order_a:
+                        continue
+                    distance_b = assigned[order_b][0]
+                    swapped_a = haversine(lat_a, lon_a, *index.positions[drone_b])
+                    swapped_b = haversine(*positions[order_b], *index.positions[drone_a])
+                    if swapped_a + swapped_b < distance_a + distance_b - 1e-6:
+                        assigned[order_a] = (swapped_a, drone_b)
+                        assigned[order_b] = (swapped_b, drone_a)
+                        owner[drone_a], owner[drone_b] = order_b, order_a
+                        distance_a, drone_a = swapped_a, drone_b
+                        improved = True
+            if not improved:
+                break
+
+    def assign(self, orders):
+        """Match a batch of ``(order_id, lat, lon)`` and reserve the chosen drones."""
+        with self._lock:
+            assignments = self.match(self.available_index(), orders)
+            # Телеметрия могла занять дрон между построением индекса и резервом
+            return [a for a in assignments if self.store.reserve(a.drone_id, a.order_id)]
+
+
+dispatcher = Dispatcher(
+    telemetry.store,
+    cell_size=settings.DISPATCH_CELL_SIZE,
+    candidates=settings.DISPATCH_CANDIDATES,
+    min_battery=settings.DISPATCH_MIN_BATTERY,
+)
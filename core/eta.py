@@ -0,0 +1,73 @@
+"""Delivery ETA estimates.
+
+This is the authoritative version of the maths checkout used to do in the
+browser: great-circle distance over a constant cruise speed plus a fixed
+take-off/landing allowance, never less than ``MIN_ETA_MINUTES``.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+
+from . import geo, telemetry
+
+MIN_ETA_MINUTES = 1.0
+# ~11 м: соседние клики по карте попадают в один ключ кэша
+COORD_PRECISION = 4
+
+
+class SpeedModel:
+    def __init__(self, cruise_speed, overhead_seconds=0.0):
+        self.cruise_speed = cruise_speed  # м/с
+        self.overhead_seconds = overhead_seconds
+
+    def minutes(self, distance_m):
+        return max(MIN_ETA_MINUTES, round((distance_m / self.cruise_speed + self.overhead_seconds) / 60, 1))
+
+    def minutes_matrix(self, distances):
+        """Vectorised :meth:`minutes` over a :func:`geo.haversine_matrix` result."""
+        if geo.np is None:
+            return [[self.minutes(d) for d in row] for row in distances]
+        minutes = (distances / self.cruise_speed + self.overhead_seconds) / 60
+        return geo.np.maximum(MIN_ETA_MINUTES, geo.np.round(minutes, 1))
+
+
+default_model = SpeedModel(settings.DRONE_CRUISE_SPEED, settings.DRONE_ETA_OVERHEAD)
+
+
+@lru_cache(maxsize=4096)
+def _cached_minutes(lat1, lon1, lat2, lon2):
+    return default_model.minutes(geo.haversine(lat1, lon1, lat2, lon2))
+
+
+def eta_minutes(origin, destination):
+    """ETA in minutes between two ``(lat, lon)`` points, cached on rounded coordinates."""
+    return _cached_minutes(
+        round(origin[0], COORD_PRECISION), round(origin[1], COORD_PRECISION),
+        round(destination[0], COORD_PRECISION), round(destination[1], COORD_PRECISION),
+    )
+
+
+def eta_matrix(origins, destinations, model=default_model):
+    return model.minutes_matrix(geo.haversine_matrix(origins, destinations))
+
+
+def fleet_positions():
+    """``(drone_ids, positions)`` of the fleet, or the base when no drone has reported."""
+    drones = telemetry.store.drones()
+    if not drones:
+        return [None], [tuple(settings.DRONE_BASE)]
+    return [d.drone_id for d in drones], [(d.lat, d.lon) for d in drones]
+
+
+def best_eta(destination):
+    """Quickest ``(drone_id, minutes)`` for ``destination`` across the fleet."""
+    drone_ids, positions = fleet_positions()
+    if len(positions) == 1:
+        return drone_ids[0], eta_minutes(positions[0], destination)
+    minutes = eta_matrix(positions, [destination])
+    if geo.np is not None:
+        best = int(geo.np.argmin(minutes[:, 0]))
+        return drone_ids[best], float(minutes[best, 0])
+    column = [row[0] for row in minutes]
+    best = column.index(min(column))
+    return drone_ids[best], column[best]
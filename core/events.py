@@ -0,0 +1,172 @@
+"""Structured order and drone lifecycle events.
+
+``emit()`` hands a typed event to the ``core.events`` logger. Its
+:class:`JsonLinesQueueHandler` (configured in ``settings.LOGGING``) only puts
+the record on a bounded in-memory queue; a background thread serialises
+records and appends them to a JSON-lines file in batches. When the queue is
+full the handler drops a record (``overflow='drop_new'`` or
+``'drop_oldest'``) and the writer reports how many were lost, so a slow disk
+can never stall a request.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OrderCreated(NamedTuple):
+    order_id: int
+    user_id: int
+    restaurant_id: int
+    total_price: float
+    latitude: float
+    longitude: float
+    name = 'order_created'
+
+
+class OrderSubmitted(NamedTuple):
+    restaurant: str
+    name = 'order_submitted'
+
+
+class DroneStarted(NamedTuple):
+    order_id: int
+    drone_id: str
+    name = 'drone_started'
+
+
+class DeliveryCompleted(NamedTuple):
+    order_id: int
+    drone_id: Optional[str]
+    name = 'delivery_completed'
+
+
+def emit(event):
+    logger.info(event.name, extra={'event': event})
+
+
+def to_json(record):
+    data = {
+        'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+        'level': record.levelname,
+        'logger': record.name,
+    }
+    event = getattr(record, 'event', None)
+    if event is not None:
+        data['event'] = event.name
+        data.update(event._asdict())
+    else:
+        data['message'] = record.getMessage()
+        if record.exc_text:
+            data['exc'] = record.exc_text
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class JsonLinesQueueHandler(logging.Handler):
+    OVERFLOW_POLICIES = ('drop_new', 'drop_oldest')
+
+    def __init__(self, path, queue_size=10_000, batch_size=500, flush_interval=1.0, overflow='drop_new',
+                 level=logging.NOTSET):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f'overflow must be one of {self.OVERFLOW_POLICIES}')
+        super().__init__(level)
+        self.path = str(path)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.dropped = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def emit(self, record):
+        if record.exc_info and not record.exc_text:
+            # Трейсбек форматируем сразу: кадры не должны жить до записи
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self._ensure_writer()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == 'drop_oldest':
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.queue.put_nowait(record)
+                except (queue.Empty, queue.Full):
+                    pass
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        # После fork (gunicorn --preload) поток писателя остаётся в родителе
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    if self._thread is None:
+                        atexit.register(self.close)
+                    self._thread = threading.Thread(target=self._run, name='event-log-writer', daemon=True)
+                    self._thread.start()
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(to_json(record))
+            except Exception:
+                self.handleError(record)
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            lines.append(json.dumps({'ts': datetime.now(timezone.utc).isoformat(), 'level': 'WARNING',
+                                     'logger': __name__, 'event': 'events_dropped', 'count': dropped}))
+        if not lines:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def _run(self):
+        while not self._stopping.is_set() or not self.queue.empty():
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = self._drain(first)
+            try:
+                self._write(batch)
+            except OSError:
+                # Диск недоступен: пачка теряется, запросы не страдают
+                self.dropped += len(batch)
+            for _ in batch:
+                self.queue.task_done()
+            # Даём накопиться следующей пачке, а не пишем по одной строке
+            if self.queue.qsize() < self.batch_size:
+                time.sleep(min(self.flush_interval, 0.05))
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far is written."""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._stopping.set()
+            self._thread.join(timeout=5.0)
+        super().close()
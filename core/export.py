@@ -0,0 +1,163 @@
+"""Streaming CSV / JSON-lines export of orders and order items.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)``, which on
+PostgreSQL is a server-side cursor, with the restaurant and menu item names
+joined in the same query. Lines are rendered as they arrive and handed out
+one chunk at a time, so an export holds a single chunk in memory however many
+rows it covers. Archived orders follow the hot ones.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+# Колонка выгрузки -> путь в values_list; у архивных моделей те же имена полей
+COLUMNS = {
+    'orders': [
+        ('order_id', 'id'),
+        ('user_id', 'user_id'),
+        ('restaurant_id', 'restaurant_id'),
+        ('restaurant', 'restaurant__name'),
+        ('status', 'status'),
+        ('drone_id', 'drone_id'),
+        ('total_price', 'total_price'),
+        ('delivery_latitude', 'delivery_latitude'),
+        ('delivery_longitude', 'delivery_longitude'),
+        ('created_at', 'created_at'),
+    ],
+    'items': [
+        ('order_id', 'order_id'),
+        ('item_id', 'id'),
+        ('menu_item_id', 'menu_item_id'),
+        ('menu_item', 'menu_item__name'),
+        ('quantity', 'quantity'),
+        ('price_at_time', 'price_at_time'),
+        ('restaurant_id', 'order__restaurant_id'),
+        ('status', 'order__status'),
+        ('created_at', 'order__created_at'),
+    ],
+}
+SOURCES = {
+    'orders': (Order, ArchivedOrder),
+    'items': (OrderItem, ArchivedOrderItem),
+}
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+class InvalidExport(ValueError):
+    pass
+
+
+class ExportFilter(NamedTuple):
+    restaurant_id: Optional[int] = None
+    status: Optional[str] = None
+    since: Optional[datetime] = None  # включительно
+    until: Optional[datetime] = None  # не включительно
+
+
+def parse_moment(value):
+    """A datetime or a date (midnight, current time zone) from a query string."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_filter(params):
+    """Build an :class:`ExportFilter` from GET parameters or command options."""
+    try:
+        restaurant_id = int(params['restaurant']) if params.get('restaurant') else None
+        since = parse_moment(params['since']) if params.get('since') else None
+        until = parse_moment(params['until']) if params.get('until') else None
+    except ValueError as e:
+        raise InvalidExport(f'Invalid filter value: {e}') from None
+    status = params.get('status') or None
+    if status is not None and status not in Order.OrderStatus.values:
+        raise InvalidExport(f'Unknown status {status!r}')
+    return ExportFilter(restaurant_id, status, since, until)
+
+
+def _lookups(dataset, export_filter):
+    prefix = 'order__' if dataset == 'items' else ''
+    lookups = {}
+    if export_filter.restaurant_id is not None:
+        lookups[f'{prefix}restaurant_id'] = export_filter.restaurant_id
+    if export_filter.status is not None:
+        lookups[f'{prefix}status'] = export_filter.status
+    if export_filter.since is not None:
+        lookups[f'{prefix}created_at__gte'] = export_filter.since
+    if export_filter.until is not None:
+        lookups[f'{prefix}created_at__lt'] = export_filter.until
+    return lookups
+
+
+def rows(dataset, export_filter=ExportFilter(), chunk_size=None):
+    """Tuples in ``COLUMNS[dataset]`` order: hot rows by id, then archived ones."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    paths = [path for _, path in COLUMNS[dataset]]
+    lookups = _lookups(dataset, export_filter)
+    for model in SOURCES[dataset]:
+        yield from (
+            model.objects
+            .filter(**lookups)
+            .order_by('id')
+            .values_list(*paths)
+            .iterator(chunk_size=chunk_size)
+        )
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_lines(header, records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(header)
+    yield buffer.getvalue()
+    for record in records:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([_plain(value) for value in record])
+        yield buffer.getvalue()
+
+
+def _jsonl_lines(header, records):
+    for record in records:
+        yield json.dumps(dict(zip(header, map(_plain, record))), ensure_ascii=False) + '\n'
+
+
+def stream(dataset, fmt, export_filter=ExportFilter(), chunk_size=None):
+    """Yield the export as text chunks of about ``chunk_size`` rows each."""
+    if dataset not in COLUMNS:
+        raise InvalidExport(f'Unknown dataset {dataset!r}')
+    if fmt not in FORMATS:
+        raise InvalidExport(f'Unknown format {fmt!r}')
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    header = [name for name, _ in COLUMNS[dataset]]
+    render = _csv_lines if fmt == 'csv' else _jsonl_lines
+    return _chunks(render(header, rows(dataset, export_filter, chunk_size)), chunk_size)
+
+
+def _chunks(lines, size):
+    # По строке на chunk — миллионы мелких записей в сокет; склеиваем пачками
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,108 @@
+"""Great-circle helpers shared by ETA, dispatch and routing."""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # NumPy ускоряет пакетный режим, но не обязателен
+    np = None
+
+EARTH_RADIUS_M = 6371e3
+
+
+def is_valid_point(lat, lon):
+    """Whether ``(lat, lon)`` are finite degrees within the coordinate ranges."""
+    # Сравнения с NaN ложны, а бесконечности вне диапазона: отдельная проверка не нужна
+    return -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distance in metres between two points given in degrees."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def haversine_matrix(origins, destinations):
+    """Distances in metres from every origin to every destination.
+
+    ``origins`` and ``destinations`` are sequences of ``(lat, lon)``. Returns
+    a ``len(origins) x len(destinations)`` NumPy array, or a list of lists
+    when NumPy is not installed.
+    """
+    if np is None:
+        return [[haversine(olat, olon, dlat, dlon) for dlat, dlon in destinations]
+                for olat, olon in origins]
+
+    o = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    d = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    lat1 = o[:, 0:1]
+    lat2 = d[:, 0][np.newaxis, :]
+    dphi = lat2 - lat1
+    dlmb = d[:, 1][np.newaxis, :] - o[:, 1:2]
+    a = np.sin(dphi / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~5 м
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """``(lat_degrees, lon_degrees)`` covered by one cell at ``precision``."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def bounding_box(lat, lon, radius_m):
+    """``(min_lat, min_lon, max_lat, max_lon)`` enclosing a circle of ``radius_m``."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = math.degrees(radius_m / (EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 1e-6)))
+    return max(lat - dlat, -90.0), max(lon - dlon, -180.0), min(lat + dlat, 90.0), min(lon + dlon, 180.0)
+
+
+def geohash_cover(min_lat, min_lon, max_lat, max_lon, max_cells=16):
+    """Set of geohash prefixes that together cover the box.
+
+    Uses the longest prefix length for which the box touches at most
+    ``max_cells`` cells, so an index range scan reads little beyond the box.
+    """
+    cover = {''}
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        cell_lat, cell_lon = geohash_cell_size(precision)
+        rows = math.floor(max_lat / cell_lat) - math.floor(min_lat / cell_lat) + 1
+        cols = math.floor(max_lon / cell_lon) - math.floor(min_lon / cell_lon) + 1
+        if rows * cols > max_cells:
+            break
+        cover = {
+            geohash_encode(min(min_lat + r * cell_lat, max_lat), min(min_lon + c * cell_lon, max_lon), precision)
+            for r in range(rows + 1)
+            for c in range(cols + 1)
+        }
+    return cover
@@ -0,0 +1,102 @@
+"""Order status state machine.
+
+Every transition is one conditional ``UPDATE ... WHERE status = <expected>``:
+of two concurrent requests only one moves the order, and an order can never
+skip a state (completing an order that never left the restaurant, starting
+one twice). Each accepted transition appends an :class:`~core.models.OrderEvent`
+row in the same transaction. :func:`transition_many` moves any number of
+orders with a single UPDATE, for the dispatcher and the simulator.
+"""
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.utils import timezone
+
+from . import events
+from .models import Order, OrderEvent
+
+Status = Order.OrderStatus
+
+# Разрешённые переходы: целевой статус -> единственный исходный
+PREVIOUS = {
+    Status.IN_TRANSIT: Status.CREATED,
+    Status.COMPLETED: Status.IN_TRANSIT,
+}
+
+LIFECYCLE_EVENTS = {
+    Status.IN_TRANSIT: events.DroneStarted,
+    Status.COMPLETED: events.DeliveryCompleted,
+}
+
+
+class IllegalTransition(Exception):
+    def __init__(self, order_id, current, target):
+        super().__init__(f'Order #{order_id} is {current}, cannot become {target}')
+        self.order_id = order_id
+        self.current = current
+        self.target = target
+
+
+def _expected(target):
+    try:
+        return PREVIOUS[target]
+    except KeyError:
+        raise ValueError(f'No transition leads to {target!r}') from None
+
+
+def _record(order_ids, source, target, drone_id):
+    now = timezone.now()
+    OrderEvent.objects.bulk_create(
+        [OrderEvent(order_id=order_id, from_status=source, to_status=target, created_at=now)
+         for order_id in order_ids],
+        batch_size=1000,
+    )
+    event = LIFECYCLE_EVENTS[target]
+
+    def emit():
+        for order_id in order_ids:
+            events.emit(event(order_id, drone_id or None))
+    transaction.on_commit(emit)
+
+
+def transition(order_id, target, user=None, **fields):
+    """Move one order to ``target``, also setting ``fields`` on it.
+
+    With ``user`` the order must belong to that user. Raises
+    ``Order.DoesNotExist``, ``PermissionDenied`` or :class:`IllegalTransition`;
+    the diagnosing read happens only when the UPDATE matched nothing.
+    """
+    source = _expected(target)
+    orders = Order.objects.filter(pk=order_id)
+    with transaction.atomic():
+        updated = orders.filter(status=source, **({'user': user} if user is not None else {})) \
+            .update(status=target, **fields)
+        if updated:
+            _record([order_id], source, target, fields.get('drone_id'))
+            return
+    row = orders.values_list('status', 'user_id').first()
+    if row is None:
+        raise Order.DoesNotExist(f'Order #{order_id} does not exist')
+    if user is not None and row[1] != user.pk:
+        raise PermissionDenied
+    raise IllegalTransition(order_id, row[0], target)
+
+
+def transition_many(order_ids, target, **fields):
+    """Move those of ``order_ids`` that are in the expected state; returns the ids moved.
+
+    Orders in any other state are skipped, not reported as errors: by the
+    time a batch is flushed some of them may have been moved elsewhere.
+    """
+    source = _expected(target)
+    with transaction.atomic():
+        # Блокируем строки, чтобы список перешедших совпал с тем, что изменил UPDATE
+        moved = list(
+            Order.objects
+            .select_for_update(skip_locked=True)
+            .filter(id__in=order_ids, status=source)
+            .values_list('id', flat=True)
+        )
+        if moved:
+            Order.objects.filter(id__in=moved, status=source).update(status=target, **fields)
+            _record(moved, source, target, fields.get('drone_id'))
+    return moved
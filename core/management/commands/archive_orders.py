@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.archive import archive_batch, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Move completed orders older than ORDER_ARCHIVE_AFTER_DAYS into the archive tables in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Orders per transaction (ORDER_ARCHIVE_BATCH by default).')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches, to leave room for live traffic.')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches.')
+
+    def handle(self, *args, **options):
+        before = archive_cutoff()
+        total = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            moved = archive_batch(before, options['batch_size'])
+            if not moved:
+                break
+            total += moved
+            batches += 1
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(f'{total} orders archived in {batches} batches (created before {before:%Y-%m-%d})')
@@ -0,0 +1,71 @@
+import json
+import platform
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from core.benchmark import SCENARIOS, run_scenario, seed
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the ordering hot paths against a freshly seeded test database '
+            'and fail if a latency or query budget is exceeded.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Data volume multiplier (1.0: 100 users with 50 orders each, 50 restaurants).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--scenario', action='append', choices=[s.name for s in SCENARIOS],
+                            help='Run only this scenario; may be repeated.')
+        parser.add_argument('--output', help='Write results as JSON to this path.')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the test database between runs.')
+        parser.add_argument('--no-budgets', action='store_true', help='Report only, never fail.')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in SCENARIOS if not options['scenario'] or s.name in options['scenario']]
+        setup_test_environment()
+        # Отдельная тестовая база: рабочие данные не трогаем
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            started = time.perf_counter()
+            data = seed(options['scale'], options['seed'])
+            self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+            results = [
+                run_scenario(scenario, data, options['requests'], options['warmup'], options['seed'])
+                for scenario in scenarios
+            ]
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        failed = []
+        self.stdout.write(f"{'scenario':<14}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'queries':>9}")
+        for result in results:
+            line = (f'{result.name:<14}{result.p50_ms:>9.2f}{result.p95_ms:>9.2f}{result.p99_ms:>9.2f}'
+                    f'{result.max_ms:>9.2f}{result.queries:>9}')
+            if result.failures:
+                failed.append(result)
+                self.stdout.write(self.style.ERROR(f"{line}  {'; '.join(result.failures)}"))
+            else:
+                self.stdout.write(line)
+
+        if options['output']:
+            report = {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'scenarios': {result.name: result.as_dict() for result in results},
+            }
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        if failed and not options['no_budgets']:
+            raise CommandError(f"Budget exceeded: {', '.join(result.name for result in failed)}")
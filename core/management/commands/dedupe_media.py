@@ -0,0 +1,54 @@
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core.models import MenuItem, Restaurant
+from core.storage import WEBP, is_hashed, variant_name
+
+IMAGE_FIELDS = [(Restaurant, 'logo_path'), (MenuItem, 'image_path')]
+
+
+class Command(BaseCommand):
+    help = ('Move uploaded images to content-addressed names, generate their variants '
+            'and report (or delete) the files nothing refers to any more.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true',
+                            help='Delete unreferenced legacy files instead of only listing them.')
+
+    def handle(self, *args, **options):
+        referenced = set()
+        directories = set()
+        for model, field_name in IMAGE_FIELDS:
+            directories.add(model._meta.get_field(field_name).upload_to.rstrip('/'))
+            changed = []
+            for obj in model.objects.filter(**{f'{field_name}__gt': ''}).only('id', field_name).iterator():
+                file = getattr(obj, field_name)
+                if not default_storage.exists(file.name):
+                    self.stderr.write(f'{model.__name__} #{obj.id}: missing file {file.name}')
+                    continue
+                if is_hashed(file.name):
+                    if not default_storage.exists(variant_name(file.name, ext=WEBP)):
+                        default_storage.generate_variants(file.name)
+                else:
+                    with default_storage.open(file.name) as content:
+                        file.name = default_storage.save(file.name, content)
+                    changed.append(obj)
+                referenced.add(file.name)
+            model.objects.bulk_update(changed, [field_name], batch_size=500)
+            self.stdout.write(f'{model.__name__}: {len(changed)} files renamed')
+
+        freed = 0
+        for directory in sorted(directories):
+            if not default_storage.exists(directory):
+                continue
+            for filename in default_storage.listdir(directory)[1]:
+                name = posixpath.join(directory, filename)
+                if is_hashed(name) or name in referenced:
+                    continue
+                freed += default_storage.size(name)
+                if options['delete']:
+                    default_storage.delete(name)
+                self.stdout.write(f"{'deleted' if options['delete'] else 'unreferenced'}: {name}")
+        self.stdout.write(f'{freed} bytes {"freed" if options["delete"] else "reclaimable with --delete"}')
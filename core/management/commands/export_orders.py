@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import export
+
+
+class Command(BaseCommand):
+    help = 'Stream orders or order items (hot and archived) as CSV or JSON lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=list(export.COLUMNS), default='orders')
+        parser.add_argument('--format', choices=list(export.FORMATS), default='csv')
+        parser.add_argument('--restaurant', type=int)
+        parser.add_argument('--status')
+        parser.add_argument('--since', help='Date or datetime, inclusive.')
+        parser.add_argument('--until', help='Date or datetime, exclusive.')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows per cursor fetch (EXPORT_CHUNK_SIZE by default).')
+        parser.add_argument('--output', help='File to write; standard output by default.')
+
+    def handle(self, *args, **options):
+        try:
+            chunks = export.stream(options['dataset'], options['format'],
+                                   export.parse_filter(options), options['chunk_size'])
+        except export.InvalidExport as e:
+            raise CommandError(e)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.market import settle
+
+
+class Command(BaseCommand):
+    help = 'Apply pending market ledger entries to user balances in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Entries per transaction (MARKET_SETTLEMENT_BATCH by default).')
+        parser.add_argument('--interval', type=float, default=0.0,
+                            help='Keep running, settling every N seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            settled = settle(options['batch_size'])
+            self.stdout.write(f'{settled} ledger entries settled')
+            if not options['interval']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.simulation import (
+    HttpSink, NullSink, RealClock, SimulationEngine, VirtualClock, synthetic_orders,
+)
+
+
+class Command(BaseCommand):
+    help = ('Run the drone flight simulator against the orders table or a synthetic load. '
+            'Pass --ingest-url to show the simulated fleet in a running web process.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drones', type=int, default=10)
+        parser.add_argument('--tick', type=float, default=0.1, help='Simulated seconds per tick.')
+        parser.add_argument('--duration', type=float, default=None,
+                            help='Simulated seconds to run; runs forever if omitted.')
+        parser.add_argument('--virtual', action='store_true',
+                            help='Use a virtual clock and run as fast as possible.')
+        parser.add_argument('--synthetic-rate', type=float, default=0.0,
+                            help='Generate this many random orders per simulated second '
+                                 'instead of reading the orders table.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--ingest-url', default='',
+                            help="Publish positions to a web process's telemetry ingest endpoint "
+                                 "(e.g. http://localhost:8000/telemetry/ingest/), which feeds the "
+                                 "dashboard and position stream. Without it positions are not "
+                                 "published anywhere; orders still change status."),
+        parser.add_argument('--telemetry-every', type=int, default=10,
+                            help='Publish positions every N ticks.')
+
+    def handle(self, *args, **options):
+        synthetic = options['synthetic_rate'] > 0
+        # Хранилище телеметрии живёт в памяти процесса: веб-процесс видит позиции только через ingest
+        if options['ingest_url']:
+            sink = HttpSink(options['ingest_url'], settings.TELEMETRY_INGEST_TOKEN)
+        else:
+            sink = NullSink()
+            if not synthetic:
+                self.stderr.write('No --ingest-url: drone positions will not reach the web process.')
+
+        engine = SimulationEngine(
+            clock=VirtualClock() if options['virtual'] else RealClock(),
+            sink=sink,
+            tick=options['tick'],
+            persist=not synthetic,
+            telemetry_every=options['telemetry_every'],
+        )
+        engine.add_drones(options['drones'])
+        on_tick = synthetic_orders(options['synthetic_rate'], seed=options['seed']) if synthetic else None
+
+        started = time.perf_counter()
+        try:
+            asyncio.run(engine.run(duration=options['duration'], on_tick=on_tick))
+        except KeyboardInterrupt:
+            pass
+        wall = time.perf_counter() - started
+        simulated = engine.ticks * engine.tick
+        self.stdout.write(
+            f'{engine.ticks} ticks, {simulated:.0f}s simulated in {wall:.1f}s '
+            f'(x{simulated / wall if wall else 0:.1f}), {engine.delivered} deliveries, '
+            f'{len(engine.queue)} orders waiting'
+        )
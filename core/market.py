@@ -0,0 +1,105 @@
+"""Market purchases and ledger settlement.
+
+A purchase touches only the product row and the buyer's row, each with a
+single conditional UPDATE, so parallel buys of different products never wait
+on each other and a product can be sold only once. The seller's credit is
+appended to the ledger instead of updating ``User.budget`` of a busy seller on
+every sale; :func:`settle` applies pending credits in batches.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Sum, Value, When
+from django.utils import timezone
+
+from . import catalog
+from .models import LedgerEntry, Product, User
+
+
+class PurchaseError(Exception):
+    pass
+
+
+class OwnProduct(PurchaseError):
+    pass
+
+
+class ProductUnavailable(PurchaseError):
+    pass
+
+
+class InsufficientFunds(PurchaseError):
+    pass
+
+
+def buy(buyer, product):
+    """Sell ``product`` to ``buyer``; raises a :class:`PurchaseError` subclass on refusal."""
+    if product.owner_id == buyer.pk:
+        raise OwnProduct
+    seller_id = product.owner_id
+    with transaction.atomic():
+        # Условие на available/owner/price: из параллельных покупок проходит одна
+        claimed = Product.objects.filter(
+            pk=product.pk, available=True, owner_id=seller_id, price=product.price,
+        ).update(owner=buyer, available=False)
+        if not claimed:
+            raise ProductUnavailable
+        debited = User.objects.filter(pk=buyer.pk, budget__gte=product.price).update(
+            budget=F('budget') - product.price,
+        )
+        if not debited:
+            raise InsufficientFunds
+        now = timezone.now()
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(user_id=buyer.pk, product=product, kind=LedgerEntry.Kind.PURCHASE,
+                        amount=-product.price, created_at=now, settled_at=now),
+            LedgerEntry(user_id=seller_id, product=product, kind=LedgerEntry.Kind.SALE,
+                        amount=product.price, created_at=now),
+        ])
+        # update() не шлёт post_save: версию для ETag каталога меняем сами
+        transaction.on_commit(lambda: catalog.bump_version(catalog.PRODUCTS))
+    buyer.budget -= product.price
+    product.owner, product.available = buyer, False
+
+
+def pending_credit(user):
+    """Sales proceeds not yet applied to ``user.budget``."""
+    return (
+        LedgerEntry.objects
+        .filter(user=user, settled_at__isnull=True)
+        .aggregate(total=Sum('amount'))['total'] or 0
+    )
+
+
+def settle_batch(batch_size=None):
+    """Apply up to ``batch_size`` pending ledger entries; returns how many were applied."""
+    batch_size = batch_size or settings.MARKET_SETTLEMENT_BATCH
+    with transaction.atomic():
+        # skip_locked: несколько процессов проведения не мешают друг другу
+        entries = list(
+            LedgerEntry.objects
+            .select_for_update(skip_locked=True)
+            .filter(settled_at__isnull=True)
+            .order_by('id')
+            .values_list('id', 'user_id', 'amount')[:batch_size]
+        )
+        if not entries:
+            return 0
+        totals = defaultdict(float)
+        for _, user_id, amount in entries:
+            totals[user_id] += amount
+        User.objects.filter(pk__in=totals).update(budget=F('budget') + Case(
+            *(When(pk=user_id, then=Value(total)) for user_id, total in totals.items()),
+            output_field=FloatField(),
+        ))
+        LedgerEntry.objects.filter(id__in=[entry[0] for entry in entries]).update(settled_at=timezone.now())
+    return len(entries)
+
+
+def settle(batch_size=None):
+    """Apply every pending entry, one batch per transaction."""
+    settled = 0
+    while count := settle_batch(batch_size):
+        settled += count
+    return settled
@@ -0,0 +1,187 @@
+"""In-process request metrics in the Prometheus text format.
+
+``RequestMetricsMiddleware`` times a sample of requests (``METRICS_SAMPLE_RATE``),
+counts their SQL queries through ``connection.execute_wrapper`` (no debug
+cursor, no stored query list beyond the request) and flags a view when one
+statement repeats ``METRICS_DUPLICATE_THRESHOLD`` times, the usual sign of an
+N+1 loop. Observations go into fixed-bucket histograms, so recording is a
+bisect and a few additions under a lock; ``/metrics/`` renders them.
+
+Streaming responses (event streams, exports) only count towards
+``django_responses_total``: their body, and the queries behind it, are
+produced after the middleware has returned, so the time and query count seen
+here would be near zero.
+"""
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}  # метка view -> [счётчики по корзинам..., сумма, количество]
+        self.lock = threading.Lock()
+
+    def observe(self, label, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label)
+            if series is None:
+                series = self.series[label] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            items = sorted((label, list(series)) for label, series in self.series.items())
+        for label, series in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {series[-2]}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {series[-1]}')
+        return lines
+
+
+class LabelCounter:
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = Counter()
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self.lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            labels = ','.join(f'{name}="{value}"' for name, value in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.request_seconds = Histogram(
+            'django_request_duration_seconds', 'Wall time of sampled requests.', TIME_BUCKETS)
+        self.db_seconds = Histogram(
+            'django_request_db_duration_seconds', 'Database time of sampled requests.', TIME_BUCKETS)
+        self.db_queries = Histogram(
+            'django_request_db_queries', 'SQL queries per sampled request.', QUERY_BUCKETS)
+        self.responses = LabelCounter(
+            'django_responses_total', 'Sampled responses by view and status code.', ('view', 'status'))
+        self.duplicate_queries = LabelCounter(
+            'django_duplicate_queries_total',
+            'Sampled requests that repeated one SQL statement (likely N+1).', ('view',))
+        self._reported = set()
+
+    def record(self, view, status, wall, db_time, queries, duplicated_sql):
+        self.request_seconds.observe(view, wall)
+        self.db_seconds.observe(view, db_time)
+        self.db_queries.observe(view, queries)
+        self.responses.inc(view, status)
+        if duplicated_sql:
+            self.duplicate_queries.inc(view)
+            if (view, duplicated_sql) not in self._reported:
+                # Одно предупреждение на пару view/запрос, чтобы не засорять лог
+                self._reported.add((view, duplicated_sql))
+                logger.warning('Repeated query in %s (possible N+1): %s', view, duplicated_sql)
+
+    def render(self):
+        lines = [
+            '# HELP django_metrics_sample_rate Fraction of requests that are measured.',
+            '# TYPE django_metrics_sample_rate gauge',
+            f'django_metrics_sample_rate {settings.METRICS_SAMPLE_RATE}',
+        ]
+        for metric in (self.request_seconds, self.db_seconds, self.db_queries,
+                       self.responses, self.duplicate_queries):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for histogram in (self.request_seconds, self.db_seconds, self.db_queries):
+            with histogram.lock:
+                histogram.series.clear()
+        for counter in (self.responses, self.duplicate_queries):
+            with counter.lock:
+                counter.values.clear()
+        self._reported.clear()
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """``execute_wrapper`` hook: counts statements and their time."""
+    __slots__ = ('count', 'seconds', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicated(self, threshold):
+        if not self.statements:
+            return None
+        sql, repeats = self.statements.most_common(1)[0]
+        return sql if repeats >= threshold else None
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.METRICS_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall = time.perf_counter() - started
+
+        match = request.resolver_match
+        # Только имена маршрутов: путь запроса раздул бы число серий
+        view = (match.view_name or match.func.__name__) if match else 'unresolved'
+        if response.streaming:
+            registry.responses.inc(view, response.status_code)
+            return response
+        registry.record(view, response.status_code, wall, recorder.seconds, recorder.count,
+                        recorder.duplicated(settings.METRICS_DUPLICATE_THRESHOLD))
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_order_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='drone_id',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
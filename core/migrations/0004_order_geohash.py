@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:38
+
+from django.db import migrations, models
+
+from core.geo import geohash_encode
+
+
+def backfill_geohash(apps, schema_editor):
+    Order = apps.get_model('core', 'Order')
+    batch = []
+    for order in Order.objects.only('id', 'delivery_latitude', 'delivery_longitude').iterator(chunk_size=2000):
+        order.geohash = geohash_encode(order.delivery_latitude, order.delivery_longitude)
+        batch.append(order)
+        if len(batch) == 2000:
+            Order.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    Order.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_order_drone_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='geohash',
+            field=models.CharField(default='', editable=False, max_length=9),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'geohash'], name='order_status_geohash_idx', opclasses=['varchar_pattern_ops', 'varchar_pattern_ops']),
+        ),
+    ]
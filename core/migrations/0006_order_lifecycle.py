@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_market_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(choices=[('created', 'Created'), ('in_transit', 'In Transit'), ('completed', 'Completed')], max_length=20)),
+                ('to_status', models.CharField(choices=[('created', 'Created'), ('in_transit', 'In Transit'), ('completed', 'Completed')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'completed'), _negated=True), fields=['status', 'created_at'], name='order_active_idx'),
+        ),
+        migrations.AddField(
+            model_name='orderevent',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='core.order'),
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
+from . import geo
+
 class User(AbstractUser):  # Using Django's AbstractUser for customization
     budget = models.FloatField(default=1000.0)
     created_at = models.DateTimeField(default=timezone.now)
@@ -59,6 +61,29 @@ class CartItem(models.Model):
     class Meta:
         unique_together = ('user', 'menu_item')  # Prevent duplicate items in cart
 
+class OrderQuerySet(models.QuerySet):
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Orders whose delivery point lies in the box, narrowed by geohash prefix first."""
+        prefixes = models.Q()
+        for prefix in geo.geohash_cover(min_lat, min_lon, max_lat, max_lon):
+            prefixes |= models.Q(geohash__startswith=prefix)
+        return self.filter(
+            prefixes,
+            delivery_latitude__range=(min_lat, max_lat),
+            delivery_longitude__range=(min_lon, max_lon),
+        )
+
+    def within_radius(self, lat, lon, radius_m):
+        """List of orders within ``radius_m`` metres, nearest first, each with ``.distance``."""
+        orders = []
+        for order in self.within_bbox(*geo.bounding_box(lat, lon, radius_m)):
+            order.distance = geo.haversine(lat, lon, order.delivery_latitude, order.delivery_longitude)
+            if order.distance <= radius_m:
+                orders.append(order)
+        orders.sort(key=lambda order: order.distance)
+        return orders
+
+
 class Order(models.Model):
     class OrderStatus(models.TextChoices):  # Using TextChoices
         CREATED = 'created', 'Created'
@@ -74,11 +99,48 @@ class Order(models.Model):
         choices=OrderStatus.choices,  # Using choices
         default=OrderStatus.CREATED
     )
+    drone_id = models.CharField(max_length=32, blank=True, default='')  # назначенный диспетчером дрон
+    geohash = models.CharField(max_length=geo.GEOHASH_PRECISION, editable=False, default='')
     created_at = models.DateTimeField(default=timezone.now)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # История заказов: WHERE user_id = ... ORDER BY created_at DESC, id DESC
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            # Поиск по району: WHERE status = ... AND geohash LIKE 'prefix%'
+            # (pattern_ops — чтобы PostgreSQL использовал индекс для LIKE при любой collation)
+            models.Index(fields=['status', 'geohash'], name='order_status_geohash_idx',
+                         opclasses=['varchar_pattern_ops', 'varchar_pattern_ops']),
+            # Очередь диспетчера: завершённые заказы (почти вся таблица) в индекс не попадают
+            models.Index(fields=['status', 'created_at'], name='order_active_idx',
+                         condition=~models.Q(status='completed')),
+            # Список заказов в админке: сортировка и фильтр по дате
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} by {self.user.username}"
 
+    def save(self, *args, **kwargs):
+        self.geohash = geo.geohash_encode(self.delivery_latitude, self.delivery_longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'delivery_latitude', 'delivery_longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
+class OrderEvent(models.Model):
+    """One accepted status transition of an order (see ``core.lifecycle``)."""
+    # Без внешнего ключа в БД: история переживает перенос заказа в архив (core.archive)
+    order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, db_constraint=False, related_name='events')
+    from_status = models.CharField(max_length=20, choices=Order.OrderStatus.choices)
+    to_status = models.CharField(max_length=20, choices=Order.OrderStatus.choices)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Order #{self.order_id}: {self.from_status} -> {self.to_status}"
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='order_items')
@@ -86,7 +148,43 @@ class OrderItem(models.Model):
     price_at_time = models.FloatField()
 
     def __str__(self):
-        return f"{self.quantity} x {self.menu_item.name} in Order #{self.order.id}"
+        return f"{self.quantity} x {self.menu_item.name} in Order #{self.order_id}"
+
+class ArchivedOrder(models.Model):
+    """A completed order moved out of the hot table by ``archive_orders``.
+
+    Same columns and primary key as :class:`Order`, so history pages and links
+    keep working after the move.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='archived_orders')
+    total_price = models.FloatField()
+    delivery_latitude = models.FloatField()
+    delivery_longitude = models.FloatField()
+    status = models.CharField(max_length=20, choices=Order.OrderStatus.choices)
+    drone_id = models.CharField(max_length=32, blank=True, default='')
+    geohash = models.CharField(max_length=geo.GEOHASH_PRECISION, editable=False, default='')
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='archived_order_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived order #{self.id}"
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='archived_order_items')
+    quantity = models.IntegerField()
+    price_at_time = models.FloatField()
+
+    def __str__(self):
+        return f"{self.quantity} x {self.menu_item_id} in archived order #{self.order_id}"
 
 class Product(models.Model):
     name = models.CharField(max_length=100)
@@ -97,4 +195,31 @@ class Product(models.Model):
     available = models.BooleanField(default=True)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class LedgerEntry(models.Model):
+    """Append-only record of a balance change.
+
+    Buyers are debited on ``User.budget`` at purchase time; sellers' credits
+    wait here with ``settled_at`` unset until ``settle_ledger`` applies them.
+    """
+    class Kind(models.TextChoices):
+        PURCHASE = 'purchase', 'Purchase'
+        SALE = 'sale', 'Sale'
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_entries')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='ledger_entries')
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    amount = models.FloatField()  # со знаком: списание отрицательное
+    created_at = models.DateTimeField(default=timezone.now)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Очередь на проведение: только непроведённые записи
+            models.Index(fields=['id'], name='ledger_unsettled_idx',
+                         condition=models.Q(settled_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.amount:+.2f} for {self.user_id} ({self.kind})"
\ No newline at end of file
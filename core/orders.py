@@ -0,0 +1,135 @@
+"""Order read and write paths shared by the views."""
+import base64
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from django.db import transaction
+from django.db.models import Prefetch, Q
+
+from . import archive, events
+from .models import ArchivedOrder, ArchivedOrderItem, CartItem, Order, OrderItem
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class EmptyCartError(Exception):
+    pass
+
+
+class OrderHistoryPage(NamedTuple):
+    orders: list
+    next_cursor: Optional[str]
+
+
+def encode_cursor(order):
+    raw = f"{order.created_at.isoformat()}|{order.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def order_history_queryset(user):
+    # Ровно два запроса на страницу: заказы с ресторанами и позиции с блюдами
+    items = OrderItem.objects.select_related('menu_item').order_by('id')
+    return (
+        Order.objects
+        .filter(user=user)
+        .select_related('restaurant')
+        .prefetch_related(Prefetch('items', queryset=items))
+        .order_by('-created_at', '-id')
+    )
+
+
+def archived_history_queryset(user):
+    items = ArchivedOrderItem.objects.select_related('menu_item').order_by('id')
+    return (
+        ArchivedOrder.objects
+        .filter(user=user)
+        .select_related('restaurant')
+        .prefetch_related(Prefetch('items', queryset=items))
+        .order_by('-created_at', '-id')
+    )
+
+
+def order_history(user, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """Return one keyset page of ``user``'s orders, newest first.
+
+    ``cursor`` is the ``next_cursor`` of the previous page; the page is
+    located through the ``(user, created_at, id)`` index instead of OFFSET,
+    so deep pages cost the same as the first one. Archived orders are merged
+    in; the archive is only queried for pages that reach past the archive
+    cutoff.
+    """
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    after_cursor = Q()
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        after_cursor = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+
+    orders = list(order_history_queryset(user).filter(after_cursor)[:limit + 1])
+    # В архиве только заказы старше границы: если вся страница новее, архив не нужен
+    if len(orders) <= limit or orders[-1].created_at < archive.archive_cutoff():
+        archived = list(archived_history_queryset(user).filter(after_cursor)[:limit + 1])
+        if archived:
+            orders = sorted(orders + archived, key=lambda order: (order.created_at, order.pk), reverse=True)
+            orders = orders[:limit + 1]
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_cursor(orders[-1])
+    return OrderHistoryPage(orders, next_cursor)
+
+
+def place_order(user, latitude, longitude):
+    """Turn ``user``'s cart into an :class:`Order` in one transaction.
+
+    The cart is read with a single joined query and locked, every
+    :class:`OrderItem` is written with one bulk insert and the cart is
+    cleared before commit, so checkout costs the same number of round trips
+    whatever the cart size and never leaves a half-written order behind.
+    Raises :class:`EmptyCartError` if there is nothing to order.
+    """
+    with transaction.atomic():
+        cart_items = list(
+            CartItem.objects
+            .filter(user=user)
+            .select_related('menu_item')
+            .select_for_update(of=('self',))
+            .order_by('id')
+        )
+        if not cart_items:
+            raise EmptyCartError
+
+        order = Order.objects.create(
+            user=user,
+            restaurant_id=cart_items[0].menu_item.restaurant_id,
+            total_price=sum(item.menu_item.price * item.quantity for item in cart_items),
+            delivery_latitude=latitude,
+            delivery_longitude=longitude,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                menu_item_id=item.menu_item_id,
+                quantity=item.quantity,
+                price_at_time=item.menu_item.price,
+            )
+            for item in cart_items
+        ])
+        CartItem.objects.filter(id__in=[item.id for item in cart_items]).delete()
+        transaction.on_commit(lambda: events.emit(events.OrderCreated(
+            order.id, user.pk, order.restaurant_id, order.total_price, latitude, longitude,
+        )))
+    return order
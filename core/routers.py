@@ -0,0 +1,134 @@
+"""Primary/replica database routing.
+
+Reads made while serving a request go to a replica from
+``settings.DATABASE_REPLICAS``, writes always go to ``default``. After the
+first write in a request, and for every request with an unsafe method, the
+request is pinned to the primary so it reads what it has just written;
+``ReplicaPinningMiddleware`` also pins the same client for
+``REPLICA_PIN_SECONDS`` afterwards, so the page after a redirect does not
+miss the new row either.
+
+Sessions and users (``PRIMARY_APPS`` and ``AUTH_USER_MODEL``) are always
+read from the primary: a session or account created a moment ago may not
+have reached a replica yet, and the client would appear logged out.
+
+A replica that lags more than ``REPLICA_MAX_LAG`` seconds behind, or can
+not be reached, is skipped until the next check. Outside a request
+(management commands, shell) everything runs on the primary unless wrapped
+in :func:`replica_reads`.
+
+Locally two SQLite aliases are enough: point ``DATABASES['replica']`` at a
+copy of the database file and set ``DATABASE_REPLICAS = ['replica']``.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+PRIMARY_APPS = ('sessions', 'auth')
+
+
+class _State:
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+@contextmanager
+def replica_reads(pinned=False):
+    """Route reads to replicas inside the block, as during a request."""
+    token = _state.set(_State(pinned))
+    try:
+        yield _state.get()
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def primary():
+    """Send every read inside the block to the primary."""
+    with replica_reads(pinned=True) as state:
+        yield state
+
+
+def replica_lag(alias):
+    """Replication delay of ``alias`` in seconds; 0 for backends without replication."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        # NULL на основной базе, и если реплика ещё ничего не проигрывала
+        cursor.execute(
+            "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+        )
+        return float(cursor.fetchone()[0])
+
+
+class PrimaryReplicaRouter:
+    def __init__(self):
+        self._checked = {}  # alias -> (проверено в, исправна ли)
+
+    def lag(self, alias):
+        return replica_lag(alias)
+
+    def healthy(self, alias):
+        now = time.monotonic()
+        checked = self._checked.get(alias)
+        if checked is None or now - checked[0] > settings.REPLICA_LAG_CHECK_INTERVAL:
+            try:
+                ok = self.lag(alias) <= settings.REPLICA_MAX_LAG
+            except DatabaseError:
+                ok = False
+            checked = self._checked[alias] = (now, ok)
+        return checked[1]
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned:
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label in PRIMARY_APPS or model._meta.label == settings.AUTH_USER_MODEL:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if self.healthy(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Все алиасы смотрят на одни и те же данные
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема приходит на реплики через репликацию
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinningMiddleware:
+    """Route a request's reads to replicas unless it writes or recently wrote."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+        with replica_reads(pinned) as state:
+            response = self.get_response(request)
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,125 @@
+"""Multi-drop mission planning.
+
+Pending orders from the same restaurant that were placed within the same
+time window are packed into missions: a nearest-neighbour tour that stops
+growing once the payload or the round-trip range would be exceeded, then
+shortened with 2-opt. One mission replaces several out-and-back flights.
+"""
+from collections import defaultdict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .geo import haversine
+from .models import Order
+
+
+class Stop(NamedTuple):
+    order_id: int
+    lat: float
+    lon: float
+    payload: int
+
+
+class Mission(NamedTuple):
+    restaurant_id: int
+    stops: list
+    distance: float  # метры, с возвратом на базу
+
+
+def route_length(origin, stops):
+    points = [origin, *((stop.lat, stop.lon) for stop in stops), origin]
+    return sum(haversine(*a, *b) for a, b in zip(points, points[1:]))
+
+
+def two_opt(origin, stops):
+    """Reverse segments of the tour while that makes it shorter."""
+    points = [origin, *((stop.lat, stop.lon) for stop in stops), origin]
+    stops = list(stops)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(points) - 2):
+            for j in range(i + 1, len(points) - 1):
+                a, b, c, d = points[i - 1], points[i], points[j], points[j + 1]
+                delta = haversine(*a, *c) + haversine(*b, *d) - haversine(*a, *b) - haversine(*c, *d)
+                if delta < -1e-6:
+                    points[i:j + 1] = reversed(points[i:j + 1])
+                    stops[i - 1:j] = reversed(stops[i - 1:j])
+                    improved = True
+    return stops
+
+
+def pack_missions(restaurant_id, origin, stops, max_payload, max_range):
+    """Split ``stops`` into missions; returns ``(missions, unservable_stops)``."""
+    remaining = list(stops)
+    missions = []
+    unservable = []
+    while remaining:
+        tour = []
+        position = origin
+        load = 0
+        flown = 0.0
+        while True:
+            best = None
+            for stop in remaining:
+                leg = haversine(*position, stop.lat, stop.lon)
+                if best is not None and leg >= best[0]:
+                    continue
+                home = haversine(stop.lat, stop.lon, *origin)
+                if load + stop.payload <= max_payload and flown + leg + home <= max_range:
+                    best = (leg, stop)
+            if best is None:
+                break
+            leg, stop = best
+            remaining.remove(stop)
+            tour.append(stop)
+            load += stop.payload
+            flown += leg
+            position = (stop.lat, stop.lon)
+
+        if not tour:
+            # Ближайший заказ не помещается даже в пустой рейс
+            unservable.extend(remaining)
+            break
+        tour = two_opt(origin, tour)
+        missions.append(Mission(restaurant_id, tour, route_length(origin, tour)))
+    return missions, unservable
+
+
+def pending_orders():
+    return (
+        Order.objects
+        .filter(status=Order.OrderStatus.CREATED, drone_id='')
+        .annotate(payload=Sum('items__quantity'))
+        .only('id', 'restaurant_id', 'delivery_latitude', 'delivery_longitude', 'created_at')
+        .order_by('created_at')
+    )
+
+
+def plan_missions(orders=None, window_minutes=None, max_payload=None, max_range=None):
+    """Group pending orders by restaurant and time window into missions.
+
+    Returns ``(missions, unservable_order_ids)``.
+    """
+    orders = pending_orders() if orders is None else orders
+    window = 60 * (window_minutes or settings.ROUTE_WINDOW_MINUTES)
+    max_payload = max_payload or settings.ROUTE_MAX_PAYLOAD
+    max_range = max_range or settings.ROUTE_MAX_RANGE
+    origin = tuple(settings.DRONE_BASE)
+
+    groups = defaultdict(list)
+    for order in orders:
+        bucket = int(order.created_at.timestamp() // window)
+        groups[order.restaurant_id, bucket].append(
+            Stop(order.id, order.delivery_latitude, order.delivery_longitude, order.payload or 0)
+        )
+
+    missions = []
+    unservable = []
+    for (restaurant_id, _), stops in groups.items():
+        packed, rejected = pack_missions(restaurant_id, origin, stops, max_payload, max_range)
+        missions.extend(packed)
+        unservable.extend(stop.order_id for stop in rejected)
+    return missions, unservable
@@ -0,0 +1,92 @@
+"""Full-text search over menu items and market products.
+
+On PostgreSQL both tables carry a generated ``search_vector`` column (name
+weighted above description, ``simple`` configuration so Russian and English
+names are both indexed as written) with a GIN index; see migration
+``0009_search_vectors``. A query becomes a prefix ``tsquery`` (``бур`` finds
+``бургер``) and results are ranked with ``ts_rank_cd``. Other databases, i.e.
+the SQLite test settings, fall back to ``icontains`` matching with a simple
+name-first ranking (SQLite ignores case for ASCII letters only).
+
+Pages are fetched with ``LIMIT page_size + 1``: the extra row tells whether a
+next page exists, so no ``COUNT(*)`` is run.
+"""
+import re
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import MenuItem, Product
+
+WORD = re.compile(r'\w+')
+
+
+class SearchPage(NamedTuple):
+    results: list
+    page: int
+    has_next: bool
+
+
+def terms(text, limit=8):
+    """Words of ``text``; tsquery operators and punctuation are dropped."""
+    return WORD.findall(text)[:limit]
+
+
+def prefix_tsquery(words):
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def _postgres_ranked(queryset, words):
+    table = queryset.model._meta.db_table
+    query = prefix_tsquery(words)
+    return (
+        queryset
+        .alias(matched=RawSQL(f"{table}.search_vector @@ to_tsquery('simple', %s)", [query],
+                              output_field=BooleanField()))
+        .filter(matched=True)
+        .annotate(rank=RawSQL(f"ts_rank_cd({table}.search_vector, to_tsquery('simple', %s))", [query],
+                              output_field=FloatField()))
+        .order_by('-rank', '-id')
+    )
+
+
+def _fallback_ranked(queryset, words):
+    for word in words:
+        queryset = queryset.filter(Q(name__icontains=word) | Q(description__icontains=word))
+    # Грубое подобие весов A/B: совпадение в начале названия выше
+    return queryset.annotate(rank=Case(
+        When(name__istartswith=words[0], then=Value(2)),
+        When(name__icontains=words[0], then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )).order_by('-rank', '-id')
+
+
+def search(queryset, text, page=1, page_size=None):
+    """One page of ``queryset`` rows matching ``text``, best match first.
+
+    An empty query lists everything, newest first.
+    """
+    page_size = max(1, min(page_size or settings.SEARCH_PAGE_SIZE, settings.SEARCH_MAX_PAGE_SIZE))
+    page = max(1, page)
+    words = terms(text)
+    if not words:
+        ranked = queryset.order_by('-id')
+    elif connections[queryset.db].vendor == 'postgresql':
+        ranked = _postgres_ranked(queryset, words)
+    else:
+        ranked = _fallback_ranked(queryset, words)
+    offset = (page - 1) * page_size
+    results = list(ranked[offset:offset + page_size + 1])
+    return SearchPage(results[:page_size], page, len(results) > page_size)
+
+
+def menu_items(text, page=1, page_size=None):
+    return search(MenuItem.objects.select_related('restaurant'), text, page, page_size)
+
+
+def products(text, page=1, page_size=None):
+    return search(Product.objects.filter(available=True).select_related('owner'), text, page, page_size)
@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import catalog
+from .models import MenuItem, Product, Restaurant
+
+
+def bump_on_commit(*scopes):
+    # До коммита параллельный читатель пересобрал бы старые строки под новой версией
+    def bump():
+        for scope in scopes:
+            catalog.bump_version(scope)
+    transaction.on_commit(bump)
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def restaurant_changed(sender, instance, **kwargs):
+    bump_on_commit(catalog.RESTAURANTS, catalog.restaurant_scope(instance.pk))
+
+
+@receiver(pre_save, sender=MenuItem)
+def menu_item_saving(sender, instance, **kwargs):
+    # Блюдо могли перенести в другой ресторан: меню прежнего тоже устарело
+    instance._previous_restaurant_id = (
+        MenuItem.objects.filter(pk=instance.pk).values_list('restaurant_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver([post_save, post_delete], sender=MenuItem)
+def menu_item_changed(sender, instance, **kwargs):
+    restaurant_ids = {instance.restaurant_id, getattr(instance, '_previous_restaurant_id', None)} - {None}
+    bump_on_commit(*(catalog.restaurant_scope(restaurant_id) for restaurant_id in restaurant_ids))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    bump_on_commit(catalog.PRODUCTS)
@@ -0,0 +1,287 @@
+"""Server-side drone flight simulator.
+
+The engine advances every drone by a fixed ``tick`` of simulated time, so a
+run is deterministic for a given seed no matter how fast the host is. With
+:class:`RealClock` it paces itself against wall time and can stand in for a
+real fleet; with :class:`VirtualClock` it runs as fast as the CPU allows,
+which is what load tests and capacity planning want.
+
+Drones fly straight lines at ``DRONE_CRUISE_SPEED``: base -> customer
+(order ``in_transit``), then back to base (order ``completed`` on arrival
+at the customer). Order status changes are flushed to the database once
+per tick in bulk, and positions are published to a telemetry sink, stamped
+with the clock's time.
+
+Orders are claimed from the database for idle drones only: the rows are
+locked with ``SKIP LOCKED`` and get their ``drone_id`` in the same
+transaction, so several simulator processes never fly the same order.
+"""
+import asyncio
+import json
+import math
+import random
+import time
+import urllib.request
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+
+from . import lifecycle, telemetry
+from .geo import haversine
+from .models import Order
+
+IDLE, OUTBOUND, RETURNING = 'idle', 'outbound', 'returning'
+
+
+class RealClock:
+    """Wall time: seconds since the epoch, but advancing monotonically."""
+
+    def __init__(self):
+        self._start = time.monotonic()
+        self._epoch = time.time()
+        self._next_tick = self._start
+
+    def now(self):
+        return self._epoch + time.monotonic() - self._start
+
+    async def sleep(self, seconds):
+        # Тик длится seconds вместе с обработкой, иначе время обработки копится в отставание;
+        # если отстали больше чем на тик, не догоняем пачкой тиков без пауз
+        now = time.monotonic()
+        self._next_tick = max(self._next_tick + seconds, now)
+        await asyncio.sleep(self._next_tick - now)
+
+
+class VirtualClock:
+    def __init__(self, start=0.0):
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    async def sleep(self, seconds):
+        self._now += seconds
+        await asyncio.sleep(0)
+
+
+class SimDrone:
+    __slots__ = ('drone_id', 'lat', 'lon', 'battery', 'phase', 'order_id',
+                 'dlat', 'dlon', 'remaining')
+
+    def __init__(self, drone_id, lat, lon):
+        self.drone_id = drone_id
+        self.lat = lat
+        self.lon = lon
+        self.battery = 100.0
+        self.phase = IDLE
+        self.order_id = None
+        self.dlat = self.dlon = 0.0  # градусы в секунду
+        self.remaining = 0.0  # секунды до цели
+
+    def fly_to(self, lat, lon, speed):
+        seconds = haversine(self.lat, self.lon, lat, lon) / speed
+        self.remaining = seconds
+        if seconds > 0:
+            self.dlat = (lat - self.lat) / seconds
+            self.dlon = (lon - self.lon) / seconds
+        else:
+            self.dlat = self.dlon = 0.0
+
+    def report(self, speed, ts):
+        return {'id': self.drone_id, 'lat': self.lat, 'lon': self.lon, 'battery': self.battery,
+                'speed': speed if self.phase != IDLE else 0.0, 'order_id': self.order_id, 'ts': ts}
+
+
+class StoreSink:
+    """Publishes positions straight into an in-process telemetry store."""
+
+    def __init__(self, store=None):
+        self.store = store or telemetry.store
+
+    async def publish(self, reports):
+        self.store.ingest(reports)
+
+
+class HttpSink:
+    """Publishes positions to a web process's ingest endpoint, like real drones."""
+
+    def __init__(self, url, token=''):
+        self.url = url
+        self.token = token
+
+    def _post(self, body):
+        request = urllib.request.Request(self.url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json',
+                                                  'X-Telemetry-Token': self.token})
+        urllib.request.urlopen(request, timeout=5).close()
+
+    async def publish(self, reports):
+        await asyncio.to_thread(self._post, json.dumps(reports).encode())
+
+
+class NullSink:
+    async def publish(self, reports):
+        pass
+
+
+class SimulationEngine:
+    def __init__(self, clock, sink=None, tick=0.1, speed=None, base=None,
+                 drain_per_km=1.0, persist=True, telemetry_every=1):
+        self.clock = clock
+        self.sink = sink or NullSink()
+        self.tick = tick
+        self.speed = speed or settings.DRONE_CRUISE_SPEED
+        self.base = tuple(base or settings.DRONE_BASE)
+        self.drain_per_second = drain_per_km * self.speed / 1000
+        self.persist = persist
+        self.telemetry_every = telemetry_every
+        self.drones = {}
+        self.idle = deque()
+        self.queue = []  # (order_id, lat, lon), ждут свободного дрона
+        self.ticks = 0
+        self.delivered = 0
+        self._started = []
+        self._completed = []
+
+    def add_drones(self, count, prefix='SIM'):
+        for n in range(len(self.drones), len(self.drones) + count):
+            drone_id = f'{prefix}_{n:05}'
+            self.drones[drone_id] = SimDrone(drone_id, *self.base)
+            self.idle.append(self.drones[drone_id])
+
+    def submit(self, order_id, lat, lon):
+        self.queue.append((order_id, lat, lon))
+
+    def _take_drones(self, count):
+        """Up to ``count`` idle drones charged enough to fly."""
+        # Свободные дроны всегда стоят на базе, поэтому ближайший — любой заряженный
+        taken = []
+        charging = []
+        while self.idle and len(taken) < count:
+            drone = self.idle.popleft()
+            (taken if drone.battery >= settings.DISPATCH_MIN_BATTERY else charging).append(drone)
+        self.idle.extend(charging)
+        return taken
+
+    def _launch(self, drone, order_id, lat, lon):
+        drone.phase = OUTBOUND
+        drone.order_id = order_id
+        drone.fly_to(lat, lon, self.speed)
+        self._started.append(order_id)
+
+    def _launch_queued(self):
+        drones = self._take_drones(len(self.queue))
+        for drone, order in zip(drones, self.queue):
+            self._launch(drone, *order)
+        self.queue = self.queue[len(drones):]
+
+    def step(self):
+        """Advance every drone by one tick of simulated time."""
+        dt = self.tick
+        drain = self.drain_per_second * dt
+        for drone in self.drones.values():
+            if drone.phase == IDLE:
+                if drone.battery < 100.0:
+                    drone.battery = min(100.0, drone.battery + 5 * drain)
+                continue
+            step = min(dt, drone.remaining)
+            drone.lat += drone.dlat * step
+            drone.lon += drone.dlon * step
+            drone.remaining -= step
+            drone.battery = max(0.0, drone.battery - drain)
+            if drone.remaining > 0:
+                continue
+            if drone.phase == OUTBOUND:
+                self._completed.append(drone.order_id)
+                self.delivered += 1
+                drone.order_id = None
+                drone.phase = RETURNING
+                drone.fly_to(*self.base, self.speed)
+            else:
+                drone.lat, drone.lon = self.base
+                drone.phase = IDLE
+                self.idle.append(drone)
+        self.ticks += 1
+
+    def _flush_statuses(self, started, completed):
+        # Одно UPDATE на переход за тик, сколько бы заказов ни сменило статус
+        if started:
+            lifecycle.transition_many(started, Order.OrderStatus.IN_TRANSIT)
+        if completed:
+            delivered = lifecycle.transition_many(completed, Order.OrderStatus.COMPLETED)
+            telemetry.store.release_orders(delivered)
+
+    def _claim_orders(self, drones):
+        """Claim one waiting order per drone; returns ``[(drone, (id, lat, lon))]``."""
+        with transaction.atomic():
+            # skip_locked: заказы, которые сейчас забирает другой процесс, достанутся ему
+            orders = list(
+                Order.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=Order.OrderStatus.CREATED, drone_id='')
+                .order_by('created_at')
+                .values_list('id', 'delivery_latitude', 'delivery_longitude')[:len(drones)]
+            )
+            claimed = list(zip(drones, orders))
+            if claimed:
+                Order.objects.filter(id__in=[order[0] for _, order in claimed]).update(drone_id=Case(
+                    *[When(id=order[0], then=Value(drone.drone_id)) for drone, order in claimed],
+                    output_field=CharField(),
+                ))
+        return claimed
+
+    async def _poll_orders(self):
+        drones = self._take_drones(len(self.idle))
+        claimed = []
+        try:
+            claimed = await sync_to_async(self._claim_orders)(drones)
+        finally:
+            self.idle.extend(drones[len(claimed):])
+        for drone, order in claimed:
+            self._launch(drone, *order)
+
+    async def run(self, duration=None, poll_every=1.0, on_tick=None):
+        """Run until ``duration`` simulated seconds have passed (forever if None)."""
+        start = self.clock.now()
+        next_poll = start
+        while duration is None or self.clock.now() - start < duration:
+            now = self.clock.now()
+            if on_tick is not None:
+                on_tick(self, now)
+            self._launch_queued()
+            # Из базы забираем заказы только для дронов, оставшихся свободными
+            if self.persist and now >= next_poll:
+                await self._poll_orders()
+                next_poll = now + poll_every
+
+            self.step()
+
+            started, self._started = self._started, []
+            completed, self._completed = self._completed, []
+            if self.persist and (started or completed):
+                await sync_to_async(self._flush_statuses)(started, completed)
+            if self.ticks % self.telemetry_every == 0:
+                ts = self.clock.now()
+                await self.sink.publish([drone.report(self.speed, ts) for drone in self.drones.values()])
+            await self.clock.sleep(self.tick)
+
+
+def synthetic_orders(rate, seed=0, radius_m=5000, base=None):
+    """``on_tick`` hook that submits random orders at ``rate`` per simulated second."""
+    rng = random.Random(seed)
+    base = tuple(base or settings.DRONE_BASE)
+    dlat = math.degrees(radius_m / 6371e3)
+    dlon = dlat / math.cos(math.radians(base[0]))
+    state = {'due': 0.0, 'next_id': 1}
+
+    def on_tick(engine, now):
+        state['due'] += rate * engine.tick
+        while state['due'] >= 1:
+            state['due'] -= 1
+            engine.submit(state['next_id'], base[0] + rng.uniform(-dlat, dlat), base[1] + rng.uniform(-dlon, dlon))
+            state['next_id'] += 1
+
+    return on_tick
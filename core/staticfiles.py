@@ -0,0 +1,194 @@
+"""Static asset build and serving.
+
+``collectstatic`` with :class:`CompressedManifestStaticFilesStorage` writes
+content-hashed copies of every file, shrinks oversized images, and writes
+``.gz`` (and ``.br`` when the ``brotli`` package is installed) next to each
+compressible file. :class:`StaticFilesMiddleware` then serves ``STATIC_ROOT``
+itself: it picks the smallest encoding the client accepts and marks hashed
+names immutable, so no CDN or front-end server is needed.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot'}
+RECOMPRESSIBLE = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG'}
+# Сжатая копия нужна, только если она заметно меньше
+MIN_SAVING = 0.9
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def accepted_encodings(header):
+    """Codings from an ``Accept-Encoding`` header, minus those with ``q=0``."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        params = params.strip().replace(' ', '')
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compress(path):
+    """Write ``.gz``/``.br`` siblings of ``path``; returns the names written."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    variants = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda: brotli.compress(data, quality=11)))
+    for suffix, encode in variants:
+        encoded = encode()
+        if len(encoded) < len(data) * MIN_SAVING:
+            with open(path + suffix, 'wb') as f:
+                f.write(encoded)
+            written.append(path + suffix)
+    return written
+
+
+def recompress_image(path):
+    """Shrink an image above ``STATIC_IMAGE_MAX_BYTES`` in place; returns True if it got smaller."""
+    fmt = RECOMPRESSIBLE.get(os.path.splitext(path)[1].lower())
+    size = os.path.getsize(path)
+    if Image is None or fmt is None or size <= settings.STATIC_IMAGE_MAX_BYTES:
+        return False
+    with Image.open(path) as image:
+        image.load()
+    limit = settings.STATIC_IMAGE_MAX_DIMENSION
+    if max(image.size) > limit:
+        image.thumbnail((limit, limit), Image.LANCZOS)
+    options = {'optimize': True}
+    if fmt == 'JPEG':
+        options.update(quality=85, progressive=True)
+    tmp_path = path + '.tmp'
+    image.save(tmp_path, fmt, **options)
+    if fmt == 'PNG' and os.path.getsize(tmp_path) > settings.STATIC_IMAGE_MAX_BYTES:
+        # Всё ещё тяжёлая: палитра из 256 цветов, прозрачность сохраняется
+        image.quantize(256, method=Image.Quantize.FASTOCTREE).save(tmp_path, fmt, **options)
+    if os.path.getsize(tmp_path) < size:
+        os.replace(tmp_path, path)
+        return True
+    os.remove(tmp_path)
+    return False
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Имена с хэшем считаются от исходника, поэтому сжатие после хэширования их не ломает
+        for name in {*paths, *self.hashed_files.values()}:
+            path = self.path(name)
+            if not os.path.exists(path):
+                continue
+            ext = os.path.splitext(name)[1].lower()
+            if ext in RECOMPRESSIBLE:
+                recompress_image(path)
+            elif ext in COMPRESSIBLE:
+                compress(path)
+
+    def stored_name(self, name):
+        # До первого collectstatic манифеста нет: отдаём исходные имена
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+
+class StaticFile:
+    __slots__ = ('path', 'content_type', 'mtime', 'immutable', 'encodings')
+
+    def __init__(self, path, immutable):
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.mtime = os.stat(path).st_mtime
+        self.immutable = immutable
+        self.encodings = [(encoding, path + suffix) for encoding, suffix in ENCODINGS
+                          if os.path.exists(path + suffix)]
+
+
+class StaticFilesMiddleware:
+    """Serve ``STATIC_ROOT`` with precompressed variants and long-lived cache headers.
+
+    Files are looked up once and remembered: ``STATIC_ROOT`` only changes on
+    deploy, which restarts the process.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.root = str(settings.STATIC_ROOT)
+        self.files = {}
+        self._hashed = None
+
+    def hashed_names(self):
+        if self._hashed is None:
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            self._hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return self._hashed
+
+    def find(self, name):
+        static_file = self.files.get(name)
+        if static_file is None:
+            try:
+                path = safe_join(self.root, name)
+            except SuspiciousFileOperation:
+                return None
+            if not os.path.isfile(path):
+                return None
+            static_file = self.files[name] = StaticFile(path, name in self.hashed_names())
+        return static_file
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefix):
+            return self.get_response(request)
+        static_file = self.find(posixpath.normpath(request.path[len(self.prefix):]).lstrip('/'))
+        if static_file is None:
+            return self.get_response(request)
+        return self.serve(request, static_file)
+
+    def serve(self, request, static_file):
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), static_file.mtime):
+            response = HttpResponseNotModified()
+        else:
+            path, encoding = static_file.path, None
+            accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            for candidate, candidate_path in static_file.encodings:
+                if candidate in accepted:
+                    path, encoding = candidate_path, candidate
+                    break
+            response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+            if encoding:
+                response['Content-Encoding'] = encoding
+            response['Last-Modified'] = http_date(static_file.mtime)
+        if static_file.encodings:
+            response['Vary'] = 'Accept-Encoding'
+        if static_file.immutable:
+            patch_cache_control(response, public=True, max_age=settings.STATIC_CACHE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=60)
+        return response
@@ -0,0 +1,100 @@
+"""Content-addressed media storage.
+
+Uploads are stored under the SHA-256 of their bytes, so uploading the same
+picture twice keeps one file. Names never change meaning, so hashed files can
+be sent with far-future ``immutable`` cache headers: by the web server in
+production, by ``serve_media`` under ``DEBUG``. Images also get resized JPEG/PNG
+and WebP variants, written once at upload time; ``{% responsive_image %}``
+turns them into ``srcset``.
+"""
+import hashlib
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASH_LENGTH = 32
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{%d}(_\d+w)?\.\w+$' % HASH_LENGTH)
+WEBP = 'webp'
+# Форматы, которые Pillow сохраняет тем же расширением
+SAVE_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+SAVE_OPTIONS = {'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+                'PNG': {'optimize': True},
+                'WEBP': {'quality': 80, 'method': 6}}
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME.search(name))
+
+
+def variant_name(name, width=None, ext=None):
+    """``dir/<hash>_<width>w.<ext>``; without ``width`` the full-size copy in ``ext``."""
+    root, original_ext = posixpath.splitext(name)
+    suffix = f'_{width}w' if width else ''
+    return f'{root}{suffix}.{ext or original_ext.lstrip(".")}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, **kwargs):
+        # Одинаковое имя значит одинаковое содержимое, перезапись безопасна
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = posixpath.split(name)
+        ext = posixpath.splitext(filename)[1].lower()
+        hashed = posixpath.join(directory, content_hash(content) + ext)
+        if self.exists(hashed):
+            return hashed
+        name = super().save(hashed, content, max_length)
+        self.generate_variants(name)
+        return name
+
+    def generate_variants(self, name):
+        """Write resized and WebP copies of an image; non-images are left alone."""
+        ext = posixpath.splitext(name)[1].lstrip('.')
+        fmt = SAVE_FORMATS.get(ext)
+        if Image is None or fmt is None:
+            return []
+        try:
+            with Image.open(self.path(name)) as image:
+                image.load()
+        except (OSError, Image.DecompressionBombError):
+            return []
+
+        written = []
+        widths = [width for width in settings.MEDIA_VARIANT_WIDTHS if width < image.width]
+        for width in [None, *widths]:
+            resized = image
+            if width:
+                resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            formats = [(WEBP, 'WEBP')] if fmt != 'WEBP' else []
+            if width:
+                formats.append((ext, fmt))
+            for variant_ext, variant_fmt in formats:
+                if variant_fmt == 'JPEG' and resized.mode not in ('RGB', 'L'):
+                    resized = resized.convert('RGB')
+                variant = variant_name(name, width, variant_ext)
+                path = self.path(variant)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                resized.save(path, variant_fmt, **SAVE_OPTIONS[variant_fmt])
+                written.append(variant)
+        return written
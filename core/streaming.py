@@ -0,0 +1,166 @@
+"""Server-Sent Events stream of live drone positions.
+
+The stream is a bare ASGI application mounted in front of Django by
+``djangoProject3/asgi.py``, so an open connection costs no middleware,
+session or auth work. One producer task polls the telemetry store for
+changes and hands each topic's encoded payload to every subscriber; a slow
+client only ever holds the latest payload, it never backs up the producer.
+
+Topics: all drones (no query string), ``?drone=<id>`` or
+``?order=<token>`` where the token comes from :func:`order_stream_token`.
+"""
+import asyncio
+import json
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core import signing
+
+from . import telemetry
+
+ALL = 'all'
+ORDER_TOKEN_SALT = 'core.streaming.order'
+
+
+def order_stream_token(order_id):
+    return signing.dumps(order_id, salt=ORDER_TOKEN_SALT)
+
+
+class Subscription:
+    __slots__ = ('topic', 'payload', 'event')
+
+    def __init__(self, topic):
+        self.topic = topic
+        self.payload = None
+        self.event = asyncio.Event()
+
+    def publish(self, payload):
+        # Последнее значение вытесняет непрочитанное
+        self.payload = payload
+        self.event.set()
+
+    async def next(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.event.clear()
+        payload, self.payload = self.payload, None
+        return payload
+
+
+class PositionBroadcaster:
+    def __init__(self, store, interval):
+        self.store = store
+        self.interval = interval
+        self.subscribers = defaultdict(set)
+        self._version = 0
+        self._task = None
+
+    def subscribe(self, topic):
+        subscription = Subscription(topic)
+        self.subscribers[topic].add(subscription)
+        payload = self.encode(self.select(topic, self.store.snapshot()))
+        if payload:
+            subscription.publish(payload)
+        if self._task is None or self._task.done():
+            self._version = self.store.version
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscribers = self.subscribers.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscribers[subscription.topic]
+
+    @staticmethod
+    def select(topic, drones):
+        if topic == ALL:
+            return drones
+        kind, _, key = topic.partition(':')
+        field = 'id' if kind == 'drone' else 'order_id'
+        return [drone for drone in drones if str(drone[field]) == key]
+
+    @staticmethod
+    def encode(drones):
+        if not drones:
+            return None
+        return f"event: positions\ndata: {json.dumps(drones)}\n\n".encode()
+
+    def publish_changes(self):
+        changed, self._version = self.store.changed_since(self._version)
+        if not changed:
+            return
+        # Каждая тема кодируется один раз, сколько бы ни было подписчиков
+        for topic, subscribers in list(self.subscribers.items()):
+            payload = self.encode(self.select(topic, changed))
+            if payload:
+                for subscription in subscribers:
+                    subscription.publish(payload)
+
+    async def run(self):
+        while self.subscribers:
+            self.publish_changes()
+            await asyncio.sleep(self.interval)
+
+
+broadcaster = PositionBroadcaster(telemetry.store, settings.POSITIONS_STREAM_INTERVAL)
+
+
+def parse_topic(query_string):
+    params = parse_qs(query_string.decode('latin-1'))
+    if 'drone' in params:
+        return f"drone:{params['drone'][0]}"
+    if 'order' in params:
+        try:
+            return f"order:{signing.loads(params['order'][0], salt=ORDER_TOKEN_SALT)}"
+        except signing.BadSignature:
+            return None
+    return ALL
+
+
+async def _send_error(send, status, message):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': message.encode()})
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def positions_stream(scope, receive, send):
+    if scope['method'] != 'GET':
+        return await _send_error(send, 405, 'Method not allowed')
+    topic = parse_topic(scope.get('query_string', b''))
+    if topic is None:
+        return await _send_error(send, 403, 'Invalid order token')
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    subscription = broadcaster.subscribe(topic)
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        while not disconnected.done():
+            update = asyncio.ensure_future(subscription.next(settings.POSITIONS_STREAM_HEARTBEAT))
+            await asyncio.wait({update, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                update.cancel()
+                break
+            # Пустой комментарий держит соединение открытым через прокси
+            await send({'type': 'http.response.body', 'body': update.result() or b': ping\n\n',
+                        'more_body': True})
+    finally:
+        broadcaster.unsubscribe(subscription)
+        disconnected.cancel()
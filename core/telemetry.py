@@ -0,0 +1,170 @@
+"""In-memory drone telemetry store.
+
+Drones report position and battery far more often than anything else in the
+app changes, so their latest state lives in process memory rather than in
+PostgreSQL: one compact ``__slots__`` record per drone plus a bounded ring
+buffer of recent fixes.
+"""
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+class DroneState:
+    __slots__ = ('drone_id', 'lat', 'lon', 'battery', 'speed', 'order_id',
+                 'updated_at', 'version', 'history')
+
+    def __init__(self, drone_id, history_size):
+        self.drone_id = drone_id
+        self.lat = 0.0
+        self.lon = 0.0
+        self.battery = 0.0
+        self.speed = 0.0
+        self.order_id = None
+        self.updated_at = 0.0
+        self.version = 0
+        # (ts, lat, lon, battery) — старые точки вытесняются автоматически
+        self.history = deque(maxlen=history_size)
+
+    def as_dict(self):
+        return {
+            'id': self.drone_id,
+            'battery': self.battery,
+            'gps': [self.lat, self.lon],
+            'speed': self.speed,
+            'order_id': self.order_id,
+            'updated_at': self.updated_at,
+        }
+
+
+class TelemetryStore:
+    def __init__(self, history_size=32):
+        self.history_size = history_size
+        self.version = 0
+        self._drones = {}
+        self._lock = threading.Lock()
+        self._snapshot = []
+        self._snapshot_version = 0
+
+    def ingest(self, reports):
+        """Apply a batch of report dicts; return ``(accepted, rejected)``.
+
+        A report needs ``id``, ``lat``, ``lon`` and ``battery``; ``ts``,
+        ``speed`` and ``order_id`` are optional. Reports older than the
+        drone's latest fix are dropped.
+        """
+        now = time.time()
+        accepted = rejected = 0
+        drones = self._drones
+        with self._lock:
+            version = self.version + 1
+            for report in reports:
+                # Сначала разбираем весь отчёт: плохое поле не должно оставить дрон полуобновлённым
+                try:
+                    drone_id = str(report['id'])
+                    lat = float(report['lat'])
+                    lon = float(report['lon'])
+                    battery = float(report['battery'])
+                    ts = report.get('ts')
+                    ts = now if ts is None else float(ts)
+                    speed = float(report.get('speed') or 0.0)
+                    has_order = 'order_id' in report
+                    order_id = report.get('order_id')
+                    if order_id is not None:
+                        order_id = int(order_id)
+                except (KeyError, TypeError, ValueError, AttributeError, OverflowError):
+                    rejected += 1
+                    continue
+                # Сравнения с NaN ложны, поэтому NaN не проходит ни одну из проверок диапазона
+                if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0
+                        and math.isfinite(ts) and math.isfinite(battery) and math.isfinite(speed)):
+                    rejected += 1
+                    continue
+
+                state = drones.get(drone_id)
+                if state is None:
+                    state = drones[drone_id] = DroneState(drone_id, self.history_size)
+                elif ts < state.updated_at:
+                    rejected += 1
+                    continue
+
+                state.lat = lat
+                state.lon = lon
+                state.battery = battery
+                state.speed = speed
+                if has_order:
+                    state.order_id = order_id
+                state.updated_at = ts
+                state.version = version
+                state.history.append((ts, lat, lon, battery))
+                accepted += 1
+            if accepted:
+                self.version = version
+        return accepted, rejected
+
+    def get(self, drone_id):
+        return self._drones.get(drone_id)
+
+    def drones(self):
+        with self._lock:
+            return list(self._drones.values())
+
+    def reserve(self, drone_id, order_id):
+        """Mark an idle drone as busy with ``order_id``; False if it is taken."""
+        with self._lock:
+            state = self._drones.get(drone_id)
+            if state is None or state.order_id is not None:
+                return False
+            self.version += 1
+            state.order_id = order_id
+            state.version = self.version
+            return True
+
+    def release(self, drone_id, order_id=None):
+        """Mark ``drone_id`` idle; with ``order_id``, only if it is still busy with that order."""
+        with self._lock:
+            state = self._drones.get(drone_id)
+            if state is not None and (order_id is None or state.order_id == order_id):
+                self.version += 1
+                state.order_id = None
+                state.version = self.version
+
+    def release_orders(self, order_ids):
+        """Mark idle every drone busy with one of ``order_ids``; returns how many were freed."""
+        order_ids = set(order_ids)
+        released = 0
+        with self._lock:
+            # Один проход по флоту на всю пачку завершённых заказов
+            for state in self._drones.values():
+                if state.order_id in order_ids:
+                    if not released:
+                        self.version += 1
+                    state.order_id = None
+                    state.version = self.version
+                    released += 1
+        return released
+
+    def changed_since(self, version):
+        """Drones updated after store ``version``, plus the current version."""
+        with self._lock:
+            changed = [state.as_dict() for state in self._drones.values() if state.version > version]
+            return changed, self.version
+
+    def snapshot(self):
+        # Между пакетами все читатели получают один и тот же готовый список
+        if self._snapshot_version != self.version:
+            with self._lock:
+                self._snapshot = [state.as_dict() for state in self._drones.values()]
+                self._snapshot_version = self.version
+        return self._snapshot
+
+    def clear(self):
+        with self._lock:
+            self._drones.clear()
+            self.version += 1
+
+
+store = TelemetryStore(history_size=settings.TELEMETRY_HISTORY_SIZE)
@@ -1,4 +1,11 @@
 from django import template
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from ..storage import WEBP, is_hashed, variant_name
 
 register = template.Library()
 
@@ -8,4 +15,57 @@ def multiply(value, arg):
     try:
         return float(value) * float(arg)
     except (ValueError, TypeError):
-        return '' 
\ No newline at end of file
+        return '' 
+
+
+DEFAULT_SIZES = '(max-width: 768px) 100vw, 33vw'
+
+
+def image_variants(name):
+    """``(fallback_srcset, webp_srcset)`` for a stored image.
+
+    Content-addressed names never change their bytes, but ``dedupe_media`` may
+    add variants later, so the lookup is cached for ``MEDIA_VARIANTS_TTL`` only.
+    """
+    if not is_hashed(name):
+        return '', ''
+    key = f'media:variants:{name}'
+    variants = caches['catalog_local'].get(key)
+    if variants is None:
+        variants = _find_variants(name)
+        caches['catalog_local'].set(key, variants, timeout=settings.MEDIA_VARIANTS_TTL)
+    return variants
+
+
+def _find_variants(name):
+    try:
+        with default_storage.open(name) as image:
+            width, _ = get_image_dimensions(image)
+    except OSError:
+        return '', ''
+    if not width:
+        return '', ''
+
+    ext = name.rsplit('.', 1)[-1]
+    fallback, webp = [], []
+    for variant_width in [w for w in settings.MEDIA_VARIANT_WIDTHS if w < width] + [None]:
+        descriptor = variant_width or width
+        for candidates, variant_ext in ((fallback, ext), (webp, WEBP)):
+            variant = variant_name(name, variant_width, variant_ext)
+            if variant == name or default_storage.exists(variant):
+                candidates.append(f'{default_storage.url(variant)} {descriptor}w')
+    return ', '.join(fallback), ', '.join(webp)
+
+
+@register.simple_tag
+def responsive_image(field, alt='', css_class='', sizes=DEFAULT_SIZES, style=''):
+    """``<picture>`` with WebP and resized sources for an ``ImageField`` value."""
+    fallback, webp = image_variants(field.name)
+    if not fallback:
+        return format_html('<img src="{}" alt="{}" class="{}" style="{}" loading="lazy">',
+                           field.url, alt, css_class, style)
+    source = format_html('<source type="image/webp" srcset="{}" sizes="{}">', webp, sizes) if webp else ''
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}" loading="lazy"></picture>',
+        source, field.url, fallback, sizes, alt, css_class, style,
+    )
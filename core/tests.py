@@ -1,3 +1,1249 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import logging
+import io
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import PermissionDenied
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.contrib.auth.models import Permission
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template import Context, Template
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (User, Restaurant, MenuItem, CartItem, Order, OrderEvent, OrderItem, Product, LedgerEntry,
+                     ArchivedOrder, ArchivedOrderItem)
+from . import (archive, benchmark, cart, catalog, eta, events, export, geo, lifecycle, market, metrics, routers,
+               search, storage, streaming, telemetry)
+from .dispatch import Dispatcher, GridIndex
+from .simulation import RealClock, SimulationEngine, StoreSink, VirtualClock
+from .staticfiles import StaticFilesMiddleware
+from .routes import Stop, pack_missions, plan_missions, route_length
+from .orders import order_history, place_order, EmptyCartError, HISTORY_PAGE_SIZE
+from .templatetags.core_extras import image_variants
+from .views import serve_media
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        restaurant = Restaurant.objects.create(name='KFC')
+        items = [MenuItem.objects.create(name=f'Item {i}', price=5, restaurant=restaurant) for i in range(3)]
+        for n in range(HISTORY_PAGE_SIZE + 5):
+            order = Order.objects.create(user=cls.user, restaurant=restaurant, total_price=15,
+                                         delivery_latitude=43.2, delivery_longitude=76.6)
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, menu_item=item, quantity=1, price_at_time=5) for item in items
+            )
+
+    def test_pages_are_disjoint_and_cover_history(self):
+        first = order_history(self.user)
+        second = order_history(self.user, cursor=first.next_cursor)
+        self.assertEqual(len(first.orders), HISTORY_PAGE_SIZE)
+        self.assertEqual(len(second.orders), 5)
+        self.assertIsNone(second.next_cursor)
+        ids = [o.id for o in first.orders + second.orders]
+        self.assertEqual(ids, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_orders_page_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        # session + user + orders + prefetched items, however long the history is
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('core:orders'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Older orders')
+
+    def test_invalid_cursor_is_404(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:orders'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class PlaceOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('bob', password='pw')
+        cls.restaurant = Restaurant.objects.create(name='Salam')
+        cls.items = [MenuItem.objects.create(name=f'Dish {i}', price=i + 1, restaurant=cls.restaurant)
+                     for i in range(10)]
+
+    def test_round_trips_do_not_depend_on_cart_size(self):
+        CartItem.objects.bulk_create(CartItem(user=self.user, menu_item=item, quantity=2) for item in self.items)
+        # savepoint, cart, order, order items, cart delete, release
+        with self.assertNumQueries(6):
+            order = place_order(self.user, 43.2, 76.6)
+        self.assertEqual(order.items.count(), 10)
+        self.assertEqual(order.total_price, 2 * sum(range(1, 11)))
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+
+    def test_empty_cart_writes_nothing(self):
+        with self.assertRaises(EmptyCartError):
+            place_order(self.user, 43.2, 76.6)
+        self.assertFalse(Order.objects.exists())
+
+    def test_anonymous_order_is_refused(self):
+        response = self.client.post(reverse('core:create_order'), {'lat': 43.2, 'lon': 76.6})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Order.objects.exists())
+
+
+class TelemetryTests(TestCase):
+    def setUp(self):
+        telemetry.store.clear()
+
+    def test_ingest_batch_and_serve_positions_without_db(self):
+        reports = [{'id': f'DRONE_{n:03}', 'lat': 43.19, 'lon': 76.63, 'battery': 90, 'ts': 100 + n}
+                   for n in range(50)]
+        reports.append({'id': 'BROKEN', 'lat': 'north'})
+        url = reverse('core:ingest_telemetry')
+        with override_settings(TELEMETRY_INGEST_TOKEN='secret'):
+            response = self.client.post(url, json.dumps(reports), content_type='application/json',
+                                        HTTP_X_TELEMETRY_TOKEN='secret')
+        self.assertEqual(response.json(), {'accepted': 50, 'rejected': 1})
+        # Без токена вне DEBUG приём закрыт
+        self.assertEqual(self.client.post(url, json.dumps(reports), content_type='application/json').status_code,
+                         403)
+
+        with self.assertNumQueries(0):
+            positions = self.client.get(reverse('core:get_positions')).json()
+        self.assertEqual(len(positions), 50)
+
+    def test_stale_reports_are_dropped_and_history_is_bounded(self):
+        store = telemetry.TelemetryStore(history_size=4)
+        store.ingest([{'id': 'D1', 'lat': 1, 'lon': 1, 'battery': 50, 'ts': t} for t in range(10)])
+        self.assertEqual(store.ingest([{'id': 'D1', 'lat': 2, 'lon': 2, 'battery': 50, 'ts': 3}]), (0, 1))
+        state = store.get('D1')
+        self.assertEqual(state.lat, 1)
+        self.assertEqual([fix[0] for fix in state.history], [6, 7, 8, 9])
+
+    def test_invalid_fields_reject_only_their_report(self):
+        store = telemetry.TelemetryStore()
+        store.ingest([{'id': 'D1', 'lat': 1, 'lon': 1, 'battery': 50, 'ts': 1}])
+        version = store.version
+        accepted, rejected = store.ingest([
+            {'id': 'D1', 'lat': 5, 'lon': 5, 'battery': 50, 'ts': 2, 'speed': 'fast'},
+            {'id': 'D1', 'lat': 6, 'lon': 6, 'battery': 50, 'ts': float('nan')},
+            {'id': 'D1', 'lat': float('inf'), 'lon': 6, 'battery': 50, 'ts': 3},
+            {'id': 'D2', 'lat': 2, 'lon': 2, 'battery': 40, 'ts': 4},
+        ])
+        self.assertEqual((accepted, rejected), (1, 3))
+        self.assertEqual((store.get('D1').lat, store.get('D1').updated_at), (1, 1))
+        self.assertGreater(store.version, version)
+        self.assertEqual(len(store.snapshot()), 2)
+
+
+class PositionStreamTests(TestCase):
+    def setUp(self):
+        telemetry.store.clear()
+
+    def test_subscribers_receive_only_their_drone(self):
+        async def scenario():
+            sent = asyncio.Queue()
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/stream/positions/',
+                     'query_string': b'drone=D2'}
+            task = asyncio.ensure_future(streaming.positions_stream(scope, receive, sent.put))
+            start = await sent.get()
+            telemetry.store.ingest([{'id': 'D1', 'lat': 1, 'lon': 1, 'battery': 80},
+                                    {'id': 'D2', 'lat': 2, 'lon': 2, 'battery': 70}])
+            body = (await asyncio.wait_for(sent.get(), 5))['body']
+            disconnect.set()
+            await asyncio.wait_for(task, 5)
+            return start, body
+
+        start, body = asyncio.run(scenario())
+        self.assertEqual(start['status'], 200)
+        drones = json.loads(body.decode().split('data: ')[1])
+        self.assertEqual([drone['id'] for drone in drones], ['D2'])
+        self.assertFalse(streaming.broadcaster.subscribers)
+
+    def test_order_topic_requires_signed_token(self):
+        self.assertEqual(streaming.parse_topic(b'order=7'), None)
+        token = streaming.order_stream_token(7)
+        self.assertEqual(streaming.parse_topic(f'order={token}'.encode()), 'order:7')
+
+
+class EtaTests(TestCase):
+    def setUp(self):
+        telemetry.store.clear()
+
+    def test_matches_scalar_model_and_picks_nearest_drone(self):
+        base = (43.1965135, 76.6309754)
+        destination = (43.2389, 76.8897)
+        expected = max(1.0, round(geo.haversine(*base, *destination) / 20 / 60, 1))
+        self.assertEqual(eta.eta_minutes(base, destination), expected)
+
+        telemetry.store.ingest([{'id': 'FAR', 'lat': 43.0, 'lon': 76.0, 'battery': 90},
+                                {'id': 'NEAR', 'lat': 43.238, 'lon': 76.889, 'battery': 90}])
+        response = self.client.post(reverse('core:calculate_eta'), {'lat': destination[0], 'lon': destination[1]})
+        self.assertEqual(response.json(), {'eta': 1.0, 'drone_id': 'NEAR'})
+
+    def test_non_finite_or_out_of_range_points_are_rejected(self):
+        for lat, lon in [('nan', '76.6'), ('43.2', 'inf'), ('91', '76.6'), ('43.2', '-180.5')]:
+            response = self.client.post(reverse('core:calculate_eta'), {'lat': lat, 'lon': lon})
+            self.assertEqual(response.status_code, 400, (lat, lon))
+        response = self.client.post(reverse('core:calculate_eta_batch'),
+                                    json.dumps({'destinations': [[43.2, 76.6]], 'origins': [[1e309, 0]]}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_returns_fleet_by_destination_matrix(self):
+        telemetry.store.ingest([{'id': f'D{n}', 'lat': 43 + n / 100, 'lon': 76.6, 'battery': 90} for n in range(3)])
+        destinations = [[43.25, 76.9], [43.1, 76.5]]
+        response = self.client.post(reverse('core:calculate_eta_batch'), json.dumps({'destinations': destinations}),
+                                    content_type='application/json')
+        body = response.json()
+        self.assertEqual(body['drone_ids'], ['D0', 'D1', 'D2'])
+        self.assertEqual(len(body['eta']), 3)
+        self.assertEqual(body['eta'][1][0], eta.eta_minutes((43.01, 76.6), (43.25, 76.9)))
+
+
+class DispatchTests(TestCase):
+    def test_grid_nearest_matches_brute_force(self):
+        rng = random.Random(1)
+        index = GridIndex(cell_size=0.01)
+        points = {f'D{n}': (43.1 + rng.random() * 0.3, 76.5 + rng.random() * 0.5) for n in range(500)}
+        for key, (lat, lon) in points.items():
+            index.insert(key, lat, lon)
+        for _ in range(20):
+            lat, lon = 43.1 + rng.random() * 0.3, 76.5 + rng.random() * 0.5
+            expected = sorted((geo.haversine(lat, lon, *p), key) for key, p in points.items())[:5]
+            self.assertEqual([key for _, key in index.nearest(lat, lon, 5)], [key for _, key in expected])
+
+    def test_batch_beats_first_come_first_served(self):
+        # Первый заказ жадно забрал бы ближайший к обоим дрон D1
+        store = telemetry.TelemetryStore()
+        store.ingest([{'id': 'D1', 'lat': 43.20, 'lon': 76.60, 'battery': 90},
+                      {'id': 'D2', 'lat': 43.20, 'lon': 76.70, 'battery': 90},
+                      {'id': 'LOW', 'lat': 43.20, 'lon': 76.61, 'battery': 5}])
+        dispatcher = Dispatcher(store, cell_size=0.01, candidates=2, min_battery=20)
+        assignments = dispatcher.assign([(1, 43.20, 76.62), (2, 43.20, 76.59)])
+        self.assertEqual({a.order_id: a.drone_id for a in assignments}, {2: 'D1', 1: 'D2'})
+        self.assertEqual(store.get('D1').order_id, 2)
+        self.assertEqual(dispatcher.assign([(3, 43.2, 76.6)]), [])
+
+    def test_single_drone_is_released_after_each_delivery(self):
+        telemetry.store.clear()
+        self.addCleanup(telemetry.store.clear)
+        telemetry.store.ingest([{'id': 'D1', 'lat': 43.2, 'lon': 76.6, 'battery': 90}])
+        user = User.objects.create_user('zoe', password='pw')
+        restaurant = Restaurant.objects.create(name='KFC')
+        self.client.force_login(user)
+        for _ in range(2):
+            order = Order.objects.create(user=user, restaurant=restaurant, total_price=5,
+                                         delivery_latitude=43.21, delivery_longitude=76.61)
+            response = self.client.post(reverse('core:start_drone'), {'order_id': order.id})
+            self.assertEqual(response.json(), {'status': 'ok', 'drone_id': 'D1'})
+            self.assertEqual(telemetry.store.get('D1').order_id, order.id)
+            response = self.client.post(reverse('core:complete_delivery'), {'order_id': order.id})
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(telemetry.store.get('D1').order_id)
+
+    def test_failed_start_returns_the_reserved_drone(self):
+        telemetry.store.clear()
+        self.addCleanup(telemetry.store.clear)
+        telemetry.store.ingest([{'id': 'D1', 'lat': 43.2, 'lon': 76.6, 'battery': 90}])
+        user = User.objects.create_user('yan', password='pw')
+        order = Order.objects.create(user=user, restaurant=Restaurant.objects.create(name='KFC'), total_price=5,
+                                     delivery_latitude=43.21, delivery_longitude=76.61)
+        self.client.force_login(user)
+        with mock.patch.object(lifecycle, 'transition', side_effect=lifecycle.IllegalTransition(
+                order.id, Order.OrderStatus.IN_TRANSIT, Order.OrderStatus.IN_TRANSIT)):
+            response = self.client.post(reverse('core:start_drone'), {'order_id': order.id})
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNone(telemetry.store.get('D1').order_id)
+
+    def test_dispatch_view_leaves_claimed_orders_and_releases_drones_on_failure(self):
+        telemetry.store.clear()
+        self.addCleanup(telemetry.store.clear)
+        telemetry.store.ingest([{'id': 'D1', 'lat': 43.2, 'lon': 76.6, 'battery': 90}])
+        user = User.objects.create_user('kim', password='pw', is_staff=True)
+        restaurant = Restaurant.objects.create(name='KFC')
+        claimed, waiting = [Order.objects.create(user=user, restaurant=restaurant, total_price=5, drone_id=drone_id,
+                                                 delivery_latitude=43.21, delivery_longitude=76.61)
+                            for drone_id in ('SIM_00000', '')]
+        self.client.force_login(user)
+        with mock.patch.object(Order.objects, 'bulk_update', side_effect=DatabaseError('deadlock')), \
+                self.assertRaises(DatabaseError):
+            self.client.post(reverse('core:dispatch_orders'))
+        self.assertIsNone(telemetry.store.get('D1').order_id)
+
+        response = self.client.post(reverse('core:dispatch_orders'))
+        self.assertEqual(response.json()['assigned'][0]['order_id'], waiting.id)
+        self.assertEqual(dict(Order.objects.values_list('id', 'drone_id')),
+                         {claimed.id: 'SIM_00000', waiting.id: 'D1'})
+
+
+class OrderGeoQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('carol', password='pw')
+        restaurant = Restaurant.objects.create(name='Yolo')
+        rng = random.Random(7)
+        for _ in range(300):
+            Order.objects.create(user=user, restaurant=restaurant, total_price=10,
+                                 delivery_latitude=43.15 + rng.random() * 0.15,
+                                 delivery_longitude=76.8 + rng.random() * 0.2)
+
+    def test_geohash_is_maintained_on_save(self):
+        order = Order.objects.first()
+        order.delivery_latitude, order.delivery_longitude = 57.64911, 10.40744
+        order.save(update_fields=['delivery_latitude', 'delivery_longitude'])
+        order.refresh_from_db()
+        self.assertEqual(order.geohash, 'u4pruydqq')
+
+    def test_radius_query_matches_exact_scan(self):
+        center = (43.22, 76.9)
+        expected = sorted(
+            o.id for o in Order.objects.all()
+            if geo.haversine(*center, o.delivery_latitude, o.delivery_longitude) <= 2000
+        )
+        found = Order.objects.filter(status=Order.OrderStatus.CREATED).within_radius(*center, 2000)
+        self.assertTrue(expected)
+        self.assertEqual(sorted(o.id for o in found), expected)
+        self.assertEqual([o.distance for o in found], sorted(o.distance for o in found))
+
+
+class RoutePlanningTests(TestCase):
+    origin = (43.1965135, 76.6309754)
+
+    def test_missions_respect_payload_and_range(self):
+        rng = random.Random(3)
+        stops = [Stop(n, 43.19 + rng.random() * 0.04, 76.62 + rng.random() * 0.04, rng.randint(1, 3))
+                 for n in range(40)]
+        far = Stop(99, 44.5, 78.0, 1)
+        missions, unservable = pack_missions(1, self.origin, stops + [far], max_payload=6, max_range=15_000)
+        self.assertEqual(unservable, [far])
+        self.assertEqual(sorted(s.order_id for m in missions for s in m.stops), list(range(40)))
+        self.assertLess(len(missions), 40)
+        for mission in missions:
+            self.assertLessEqual(sum(s.payload for s in mission.stops), 6)
+            self.assertLessEqual(mission.distance, 15_000)
+            self.assertAlmostEqual(mission.distance, route_length(self.origin, mission.stops))
+
+    def test_plan_groups_pending_orders_by_restaurant(self):
+        user = User.objects.create_user('dave', password='pw')
+        kfc, salam = Restaurant.objects.create(name='KFC'), Restaurant.objects.create(name='Salam')
+        for restaurant in (kfc, kfc, salam):
+            order = Order.objects.create(user=user, restaurant=restaurant, total_price=5,
+                                         delivery_latitude=43.2, delivery_longitude=76.64)
+            OrderItem.objects.create(order=order, menu_item=MenuItem.objects.create(
+                name='x', price=5, restaurant=restaurant), quantity=1, price_at_time=5)
+        missions, unservable = plan_missions()
+        self.assertEqual(unservable, [])
+        self.assertEqual(sorted(len(m.stops) for m in missions), [1, 2])
+
+
+class SimulationTests(TransactionTestCase):
+    def test_engine_delivers_orders_on_a_virtual_clock(self):
+        user = User.objects.create_user('erin', password='pw')
+        restaurant = Restaurant.objects.create(name='KFC')
+        order = Order.objects.create(user=user, restaurant=restaurant, total_price=5,
+                                     delivery_latitude=43.21, delivery_longitude=76.65)
+        store = telemetry.TelemetryStore()
+        engine = SimulationEngine(VirtualClock(), sink=StoreSink(store), tick=1.0)
+        engine.add_drones(2)
+
+        asyncio.run(engine.run(duration=5))
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.OrderStatus.IN_TRANSIT)
+        self.assertEqual(store.get('SIM_00000').order_id, order.id)
+
+        # ~2 км в одну сторону при 20 м/с: десяти минут хватит на рейс туда и обратно
+        asyncio.run(engine.run(duration=600))
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.OrderStatus.COMPLETED)
+        self.assertEqual(engine.delivered, 1)
+        self.assertEqual(len(engine.idle), 2)
+        state = store.get('SIM_00000')
+        self.assertEqual((state.lat, state.lon), (43.1965135, 76.6309754))
+
+    def test_claimed_orders_get_a_drone_and_are_not_claimed_twice(self):
+        user = User.objects.create_user('erin', password='pw')
+        restaurant = Restaurant.objects.create(name='KFC')
+        orders = [Order.objects.create(user=user, restaurant=restaurant, total_price=5,
+                                       delivery_latitude=43.21, delivery_longitude=76.65) for _ in range(3)]
+        first = SimulationEngine(VirtualClock(), tick=1.0)
+        first.add_drones(2)
+        claimed = first._claim_orders(first._take_drones(2))
+        self.assertEqual([order[0] for _, order in claimed], [orders[0].id, orders[1].id])
+        self.assertEqual(dict(Order.objects.exclude(drone_id='').values_list('id', 'drone_id')),
+                         {orders[0].id: 'SIM_00000', orders[1].id: 'SIM_00001'})
+
+        second = SimulationEngine(VirtualClock(), tick=1.0)
+        second.add_drones(2, prefix='ALT')
+        claimed = second._claim_orders(second._take_drones(2))
+        self.assertEqual([(drone.drone_id, order[0]) for drone, order in claimed], [('ALT_00000', orders[2].id)])
+
+    def test_command_warns_that_positions_stay_local_without_ingest_url(self):
+        stderr = io.StringIO()
+        call_command('simulate', '--virtual', '--duration', '1', '--drones', '1', stdout=io.StringIO(), stderr=stderr)
+        self.assertIn('--ingest-url', stderr.getvalue())
+        with mock.patch('core.simulation.HttpSink._post') as post:
+            call_command('simulate', '--virtual', '--duration', '1', '--drones', '1', '--telemetry-every', '1',
+                         '--ingest-url', 'http://web/telemetry/ingest/', stdout=io.StringIO())
+        self.assertTrue(post.called)
+
+    def test_real_clock_subtracts_processing_time(self):
+        sleeps = []
+
+        async def sleep(seconds):
+            sleeps.append(round(seconds, 6))
+
+        with mock.patch('core.simulation.time.monotonic', return_value=100.0):
+            clock = RealClock()
+        with mock.patch('core.simulation.asyncio.sleep', sleep):
+            # Тики обработаны за 0.3 с, мгновенно и с отставанием больше тика
+            for processed_at in (100.3, 101.0, 103.5):
+                with mock.patch('core.simulation.time.monotonic', return_value=processed_at):
+                    asyncio.run(clock.sleep(1.0))
+        self.assertEqual(sleeps, [0.7, 1.0, 0.0])
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.create(name='KFC')
+        cls.item = MenuItem.objects.create(name='Bucket', price=12, restaurant=cls.restaurant)
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['catalog_local'].clear()
+        caches['template_fragments'].clear()
+
+    def test_menu_page_hits_database_once_per_version(self):
+        url = reverse('core:restaurant_menu', args=[self.restaurant.id])
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Bucket')
+
+        self.item.name = 'Twister'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.save()
+        with self.assertNumQueries(2):
+            self.assertContains(self.client.get(url), 'Twister')
+
+    def test_menu_grid_fragment_is_cached_per_version_with_late_csrf_token(self):
+        url = reverse('core:restaurant_menu', args=[self.restaurant.id])
+        self.assertContains(self.client.get(url), 'Login to Order')
+        self.client.force_login(User.objects.create_user('grace', password='pw'))
+        response = self.client.get(url)
+        self.assertContains(response, 'Add to Cart')
+        self.assertContains(response, f"input.value = '{response.context['csrf_token']}'")
+
+        version = catalog.get_version(catalog.restaurant_scope(self.restaurant.id))
+        key = make_template_fragment_key('menu_grid', [self.restaurant.id, version, True])
+        self.assertIn('Add to Cart', caches['template_fragments'].get(key))
+        later = time.time() + settings.CATALOG_TTL + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertIsNone(caches['template_fragments'].get(key))
+
+        self.item.description = 'Extra crispy'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.save()
+        self.assertContains(self.client.get(url), 'Extra crispy')
+
+    def test_stale_grid_during_rebuild_is_not_cached_under_the_new_version(self):
+        url = reverse('core:restaurant_menu', args=[self.restaurant.id])
+        self.assertContains(self.client.get(url), 'Bucket')
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.create(name='Wings', price=4, restaurant=self.restaurant)
+        # Другой процесс держит блокировку пересборки: страница из прежней версии
+        version = catalog.get_version(catalog.restaurant_scope(self.restaurant.id))
+        lock_key = f'catalog:{catalog.restaurant_scope(self.restaurant.id)}:v{version}:lock'
+        caches['default'].add(lock_key, 1)
+        caches['catalog_local'].clear()
+        self.assertNotContains(self.client.get(url), 'Wings')
+
+        caches['default'].delete(lock_key)
+        self.assertContains(self.client.get(url), 'Wings')
+
+    def test_versions_bump_after_commit_for_old_and_new_restaurant(self):
+        salam = Restaurant.objects.create(name='Salam')
+        scopes = [catalog.restaurant_scope(self.restaurant.id), catalog.restaurant_scope(salam.id)]
+        before = [catalog.get_version(scope) for scope in scopes]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.restaurant = salam
+            self.item.save()
+            # До коммита версия прежняя: пересборка не закэширует старые строки под новым номером
+            self.assertEqual([catalog.get_version(scope) for scope in scopes], before)
+        after = [catalog.get_version(scope) for scope in scopes]
+        self.assertTrue(all(new > old for new, old in zip(after, before)))
+
+    def test_missing_restaurant_is_404(self):
+        response = self.client.get(reverse('core:restaurant_menu', args=[self.restaurant.id + 100]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_concurrent_rebuild_serves_stale_value(self):
+        catalog.restaurants()
+        Restaurant.objects.create(name='Salam')
+        version = catalog.get_version(catalog.RESTAURANTS)
+        # Другой процесс уже пересобирает новую версию
+        caches['default'].add(f'catalog:{catalog.RESTAURANTS}:v{version}:lock', 1)
+        with self.assertNumQueries(0):
+            self.assertEqual([r.name for r in catalog.restaurants()], ['KFC'])
+
+
+class CartServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('frank', password='pw')
+        restaurant = Restaurant.objects.create(name='KFC')
+        cls.items = [MenuItem.objects.create(name=f'Meal {i}', price=2.5 * (i + 1), restaurant=restaurant)
+                     for i in range(5)]
+
+    def test_add_is_a_single_upsert(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(cart.add_item(self.user, self.items[0].id, 2))
+        with self.assertNumQueries(1):
+            self.assertTrue(cart.add_item(self.user, self.items[0].id, 3))
+        self.assertEqual(CartItem.objects.get(user=self.user).quantity, 5)
+        self.assertFalse(cart.add_item(self.user, 10_000, 1))
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_cart_and_checkout_pages_use_a_fixed_number_of_queries(self):
+        for item in self.items:
+            cart.add_item(self.user, item.id, 2)
+        self.client.force_login(self.user)
+        # session + user + cart lines with totals
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('core:cart'))
+        self.assertEqual(response.context['total'], 2 * 2.5 * (1 + 2 + 3 + 4 + 5))
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('core:checkout'))
+        self.assertEqual(response.context['total'], 75.0)
+        self.assertEqual([line.subtotal for line in response.context['cart_items']], [5.0, 10.0, 15.0, 20.0, 25.0])
+
+    def test_update_and_remove_are_scoped_to_owner(self):
+        cart.add_item(self.user, self.items[0].id, 1)
+        line = CartItem.objects.get(user=self.user)
+        other = User.objects.create_user('mallory', password='pw')
+        self.assertFalse(cart.update_item(other, line.id, 9))
+        self.assertFalse(cart.remove_item(other, line.id))
+        self.assertTrue(cart.update_item(self.user, line.id, 9))
+        self.assertTrue(cart.remove_item(self.user, line.id))
+
+
+class FixedLagRouter(routers.PrimaryReplicaRouter):
+    def __init__(self, lags):
+        super().__init__()
+        self.lags = lags
+
+    def lag(self, alias):
+        if self.lags[alias] is None:
+            raise DatabaseError('replica is down')
+        return self.lags[alias]
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], REPLICA_MAX_LAG=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def test_reads_outside_a_request_use_the_primary(self):
+        router = FixedLagRouter({'replica1': 0, 'replica2': 0})
+        self.assertEqual(router.db_for_read(Order), 'default')
+
+    def test_reads_go_to_replicas_until_the_first_write(self):
+        router = FixedLagRouter({'replica1': 0, 'replica2': 0})
+        with routers.replica_reads() as state:
+            self.assertIn(router.db_for_read(Order), {'replica1', 'replica2'})
+            self.assertEqual(router.db_for_write(Order), 'default')
+            self.assertEqual(router.db_for_read(Order), 'default')
+        self.assertTrue(state.wrote)
+
+    def test_lagging_or_broken_replicas_fall_back_to_the_primary(self):
+        router = FixedLagRouter({'replica1': 30, 'replica2': None})
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_read(Order), 'default')
+            router.lags['replica1'] = 0
+            # Результат проверки кэшируется до следующего интервала
+            self.assertEqual(router.db_for_read(Order), 'default')
+            router._checked.clear()
+            self.assertEqual(router.db_for_read(Order), 'replica1')
+
+
+# Алиас-зеркало основной базы есть только в тестовом прогоне: модуль импортируется раньше,
+# чем раннер готовит базы, и тот подключает 'replica' к тестовой базе default
+_primary = connections.settings[DEFAULT_DB_ALIAS]
+connections.settings.setdefault('replica', {**_primary, 'TEST': {**_primary['TEST'], 'MIRROR': DEFAULT_DB_ALIAS}})
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaAliasRoutingTests(TransactionTestCase):
+    # TransactionTestCase: внутри транзакции TestCase роутер всегда читает с основной базы
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(name='KFC')
+
+    def queries(self, block):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            block()
+        return len(primary), len(replica)
+
+    def test_reads_use_the_replica_and_writes_and_pinned_reads_the_primary(self):
+        with routers.replica_reads():
+            self.assertEqual(self.queries(lambda: list(Restaurant.objects.all())), (0, 1))
+            self.assertEqual(self.queries(lambda: Restaurant.objects.create(name='Salam')), (1, 0))
+            # После записи запрос закреплён за основной базой
+            self.assertEqual(self.queries(lambda: list(Restaurant.objects.all())), (1, 0))
+        with routers.primary():
+            self.assertEqual(self.queries(lambda: list(Restaurant.objects.all())), (1, 0))
+
+    def test_sessions_and_users_are_read_from_the_primary(self):
+        user = User.objects.create_user('mia', password='pw')
+        with routers.replica_reads():
+            self.assertEqual(self.queries(lambda: User.objects.get(id=user.id)), (1, 0))
+            self.assertEqual(self.queries(lambda: list(Session.objects.all())), (1, 0))
+            self.assertEqual(self.queries(lambda: list(Permission.objects.all()[:1])), (1, 0))
+
+
+class ReplicaPinningMiddlewareTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_a_write_pins_the_client_to_the_primary(self):
+        def view(request):
+            User.objects.create_user('bob', password='pw')
+            return HttpResponse()
+
+        response = routers.ReplicaPinningMiddleware(view)(self.factory.get('/'))
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_read_only_requests_are_not_pinned(self):
+        seen = []
+
+        def view(request):
+            seen.append(routers._state.get().pinned)
+            return HttpResponse()
+
+        response = routers.ReplicaPinningMiddleware(view)(self.factory.get('/'))
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        routers.ReplicaPinningMiddleware(view)(self.factory.post('/'))
+        self.assertEqual(seen, [False, True])
+
+
+class MarketLedgerTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pw', budget=0)
+        self.buyer = User.objects.create_user('buyer', password='pw', budget=100)
+        self.product = Product.objects.create(name='Drone', price=60, owner=self.seller)
+
+    def test_purchase_debits_buyer_and_credits_seller_on_settlement(self):
+        market.buy(self.buyer, self.product)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.owner, self.buyer)
+        self.assertFalse(self.product.available)
+        self.assertEqual(User.objects.get(pk=self.buyer.pk).budget, 40)
+        self.assertEqual(market.pending_credit(self.seller), 60)
+        self.assertEqual(User.objects.get(pk=self.seller.pk).budget, 0)
+
+        self.assertEqual(market.settle(batch_size=1), 1)
+        self.assertEqual(User.objects.get(pk=self.seller.pk).budget, 60)
+        self.assertEqual(market.pending_credit(self.seller), 0)
+        self.assertEqual(LedgerEntry.objects.count(), 2)
+
+    def test_a_product_is_sold_once(self):
+        other = User.objects.create_user('other', password='pw', budget=100)
+        stale_copy = Product.objects.get(pk=self.product.pk)
+        market.buy(self.buyer, self.product)
+        with self.assertRaises(market.ProductUnavailable):
+            market.buy(other, stale_copy)
+        self.assertEqual(User.objects.get(pk=other.pk).budget, 100)
+
+    def test_refused_purchase_leaves_no_trace(self):
+        self.product.price = 150
+        self.product.save()
+        with self.assertRaises(market.InsufficientFunds):
+            market.buy(self.buyer, self.product)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.owner, self.seller)
+        self.assertTrue(self.product.available)
+        self.assertFalse(LedgerEntry.objects.exists())
+        with self.assertRaises(market.OwnProduct):
+            market.buy(self.seller, self.product)
+
+    def test_buy_view(self):
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('core:buy_product', args=[self.product.id]))
+        self.assertRedirects(response, reverse('core:observe'), fetch_redirect_response=False)
+        response = self.client.get(reverse('core:market'))
+        self.assertContains(response, 'Balance: $40.00')
+
+
+def png_bytes(width, height, color='red'):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=media_root.name, MEDIA_VARIANT_WIDTHS=(320, 640))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        caches['catalog_local'].clear()
+
+    def test_identical_uploads_share_one_file_with_variants(self):
+        data = png_bytes(800, 400)
+        first = default_storage.save('menu_item_images/a.png', ContentFile(data))
+        second = default_storage.save('menu_item_images/b_copy.png', ContentFile(data))
+        self.assertEqual(first, second)
+        self.assertTrue(storage.is_hashed(first))
+        for variant in [storage.variant_name(first, 320), storage.variant_name(first, 640, 'webp'),
+                        storage.variant_name(first, ext='webp')]:
+            self.assertTrue(default_storage.exists(variant), variant)
+        self.assertEqual(len(default_storage.listdir('menu_item_images')[1]), 6)
+
+    def test_responsive_image_and_cache_headers(self):
+        restaurant = Restaurant.objects.create(name='KFC')
+        item = MenuItem.objects.create(name='Bucket', price=5, restaurant=restaurant)
+        item.image_path.save('bucket.png', ContentFile(png_bytes(700, 700, 'blue')))
+        html = Template('{% load core_extras %}{% responsive_image item.image_path alt=item.name %}').render(
+            Context({'item': item}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f"{storage.variant_name(item.image_path.url, 320, 'webp')} 320w", html)
+        self.assertIn(f'{item.image_path.url} 700w', html)
+
+        response = serve_media(RequestFactory().get(item.image_path.url), item.image_path.name)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_variants_added_later_are_found_after_ttl(self):
+        name = default_storage.save('menu_item_images/a.png', ContentFile(png_bytes(700, 700)))
+        for variant in default_storage.listdir('menu_item_images')[1]:
+            if variant.endswith('.webp'):
+                default_storage.delete(f'menu_item_images/{variant}')
+        self.assertEqual(image_variants(name)[1], '')
+        default_storage.generate_variants(name)
+        self.assertEqual(image_variants(name)[1], '')
+        later = time.time() + settings.MEDIA_VARIANTS_TTL + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertIn('320w', image_variants(name)[1])
+
+    def test_dedupe_command_renames_legacy_files(self):
+        restaurant = Restaurant.objects.create(name='KFC')
+        for name in ['shawarma.jpg', 'shawarma_xiCMvpU.jpg']:
+            path = default_storage.path(f'menu_item_images/{name}')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(png_bytes(100, 100))
+            MenuItem.objects.create(name=name, price=5, restaurant=restaurant,
+                                    image_path=f'menu_item_images/{name}')
+        call_command('dedupe_media', '--delete', stdout=io.StringIO())
+        names = set(MenuItem.objects.values_list('image_path', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(storage.is_hashed(names.pop()))
+        self.assertFalse(default_storage.exists('menu_item_images/shawarma.jpg'))
+
+
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        source = tempfile.TemporaryDirectory()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(root.cleanup)
+        with open(os.path.join(source.name, 'app.css'), 'w') as f:
+            f.write('body { color: #333; }\n' * 200)
+        from PIL import Image
+        rng = random.Random(1)
+        noise = Image.new('RGB', (300, 300))
+        noise.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(300 * 300)])
+        noise.save(os.path.join(source.name, 'noise.png'))
+        self.original_png_size = os.path.getsize(os.path.join(source.name, 'noise.png'))
+
+        settings_override = self.settings(
+            STATICFILES_DIRS=[source.name], STATIC_ROOT=root.name, STATIC_IMAGE_MAX_BYTES=10_000,
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_collectstatic_fingerprints_compresses_and_shrinks(self):
+        url = staticfiles_storage.url('app.css')
+        self.assertRegex(url, r'/static/app\.[0-9a-f]{12}\.css$')
+        self.assertTrue(staticfiles_storage.exists(staticfiles_storage.stored_name('app.css') + '.gz'))
+        png = staticfiles_storage.stored_name('noise.png')
+        self.assertLess(staticfiles_storage.size(png), self.original_png_size)
+
+    def test_middleware_serves_precompressed_immutable_files(self):
+        url = staticfiles_storage.url('app.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Content-Type'], 'text/css')
+
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b'body { color: #333; }\n' * 200)
+
+        response = self.client.get('/static/app.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        middleware = StaticFilesMiddleware(lambda request: None)
+        self.assertIsNone(middleware.find('../manage.py'))
+
+
+class BenchmarkQueryBudgetTests(TestCase):
+    """Query budgets of the benchmark scenarios; latency is left to ``manage.py benchmark``."""
+
+    def setUp(self):
+        for alias in ('default', 'catalog_local', 'template_fragments'):
+            caches[alias].clear()
+        self.addCleanup(telemetry.store.clear)
+
+    def test_scenarios_stay_within_query_budgets(self):
+        data = benchmark.seed(scale=0.05)
+        for scenario in benchmark.SCENARIOS:
+            with self.subTest(scenario.name):
+                result = benchmark.run_scenario(scenario, data, requests=5, warmup=2)
+                self.assertLessEqual(result.queries, result.budget.queries)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+
+    def test_requests_are_aggregated_per_view(self):
+        user = User.objects.create_user('heidi', password='pw')
+        self.client.force_login(user)
+        self.client.get(reverse('core:orders'))
+        self.client.get(reverse('core:orders'))
+        body = metrics.registry.render()
+        self.assertIn('django_request_duration_seconds_count{view="core:orders"} 2', body)
+        self.assertIn('django_request_db_queries_bucket{view="core:orders",le="5"} 2', body)
+        self.assertIn('django_responses_total{view="core:orders",status="200"} 2', body)
+
+    def test_repeated_statement_is_flagged(self):
+        def view(request):
+            for _ in range(settings.METRICS_DUPLICATE_THRESHOLD):
+                list(Order.objects.filter(id=1))
+            return HttpResponse()
+
+        with self.assertLogs('core.metrics', 'WARNING'):
+            metrics.RequestMetricsMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn('django_duplicate_queries_total{view="unresolved"} 1', metrics.registry.render())
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_sampling_switch(self):
+        self.client.get(reverse('core:home'))
+        self.assertNotIn('view="core:home"', metrics.registry.render())
+
+    def test_streaming_responses_are_counted_but_not_timed(self):
+        def view(request):
+            return StreamingHttpResponse(iter(['a', 'b']))
+
+        metrics.RequestMetricsMiddleware(view)(RequestFactory().get('/'))
+        body = metrics.registry.render()
+        self.assertIn('django_responses_total{view="unresolved",status="200"} 1', body)
+        self.assertNotIn('django_request_duration_seconds_count{view="unresolved"}', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_token(self):
+        self.assertEqual(reverse('core:metrics'), '/metrics/')
+        self.assertEqual(self.client.get(reverse('core:metrics')).status_code, 401)
+        response = self.client.get(reverse('core:metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_endpoint_without_token_is_staff_only(self):
+        self.assertEqual(self.client.get(reverse('core:metrics')).status_code, 403)
+        self.client.force_login(User.objects.create_user('ivan', password='pw', is_staff=True))
+        self.assertEqual(self.client.get(reverse('core:metrics')).status_code, 200)
+
+
+class EventLogTests(TestCase):
+    def make_handler(self, **kwargs):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        handler = events.JsonLinesQueueHandler(os.path.join(directory.name, 'events.jsonl'), **kwargs)
+        self.addCleanup(handler.close)
+        logger = logging.getLogger('core.events')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return handler
+
+    def read(self, handler):
+        handler.flush()
+        with open(handler.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_lifecycle_events_are_written_as_json_lines(self):
+        handler = self.make_handler(batch_size=10, flush_interval=0.05)
+        user = User.objects.create_user('ivan', password='pw')
+        item = MenuItem.objects.create(name='Bucket', price=7, restaurant=Restaurant.objects.create(name='KFC'))
+        CartItem.objects.create(user=user, menu_item=item, quantity=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(user, 43.2, 76.9)
+        events.emit(events.DroneStarted(order.id, 'DR-1'))
+
+        lines = self.read(handler)
+        self.assertEqual([line['event'] for line in lines], ['order_created', 'drone_started'])
+        self.assertEqual(lines[0]['order_id'], order.id)
+        self.assertEqual(lines[0]['total_price'], 14)
+        self.assertEqual(lines[1]['drone_id'], 'DR-1')
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = self.make_handler(queue_size=2, overflow='drop_oldest')
+        handler._ensure_writer = lambda: None  # писатель ещё не запущен, очередь не разбирается
+        for order_id in range(5):
+            events.emit(events.DeliveryCompleted(order_id, None))
+        self.assertEqual(handler.dropped, 3)
+        del handler._ensure_writer
+        handler._ensure_writer()
+
+        lines = self.read(handler)
+        self.assertEqual([line.get('order_id') for line in lines if line['event'] == 'delivery_completed'], [3, 4])
+        self.assertIn({'event': 'events_dropped', 'count': 3},
+                      [{'event': line['event'], 'count': line.get('count')} for line in lines])
+
+    def test_app_errors_reach_the_console(self):
+        console = next(handler for handler in logging.getLogger('core').handlers
+                       if type(handler) is logging.StreamHandler)
+        stream = io.StringIO()
+        previous = console.setStream(stream)
+        self.addCleanup(console.setStream, previous)
+        logging.getLogger('core.views').error('Error creating order')
+        events.emit(events.DeliveryCompleted(1, None))
+        # Ошибка видна в консоли, события туда не дублируются
+        self.assertEqual(stream.getvalue(), 'Error creating order\n')
+
+
+class OrderLifecycleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('fay', password='pw')
+        cls.restaurant = Restaurant.objects.create(name='KFC')
+
+    def make_order(self, **kwargs):
+        return Order.objects.create(user=self.user, restaurant=self.restaurant, total_price=5,
+                                    delivery_latitude=43.2, delivery_longitude=76.6, **kwargs)
+
+    def test_transition_is_one_conditional_update_plus_event(self):
+        order = self.make_order()
+        with self.assertNumQueries(4):  # UPDATE и INSERT между SAVEPOINT и RELEASE
+            lifecycle.transition(order.id, Order.OrderStatus.IN_TRANSIT, user=self.user, drone_id='DR-7')
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.drone_id), (Order.OrderStatus.IN_TRANSIT, 'DR-7'))
+        self.assertEqual(list(order.events.values_list('from_status', 'to_status')),
+                         [(Order.OrderStatus.CREATED, Order.OrderStatus.IN_TRANSIT)])
+
+    def test_illegal_and_foreign_transitions_are_refused(self):
+        order = self.make_order()
+        with self.assertRaises(lifecycle.IllegalTransition) as raised:
+            lifecycle.transition(order.id, Order.OrderStatus.COMPLETED)
+        self.assertEqual(raised.exception.current, Order.OrderStatus.CREATED)
+        stranger = User.objects.create_user('mallory', password='pw')
+        with self.assertRaises(PermissionDenied):
+            lifecycle.transition(order.id, Order.OrderStatus.IN_TRANSIT, user=stranger)
+        with self.assertRaises(Order.DoesNotExist):
+            lifecycle.transition(order.id + 100, Order.OrderStatus.IN_TRANSIT)
+        self.assertFalse(OrderEvent.objects.exists())
+
+    def test_transition_many_moves_only_orders_in_the_expected_state(self):
+        waiting = [self.make_order() for _ in range(3)]
+        done = self.make_order(status=Order.OrderStatus.COMPLETED)
+        moved = lifecycle.transition_many([o.id for o in waiting] + [done.id], Order.OrderStatus.IN_TRANSIT)
+        self.assertCountEqual(moved, [o.id for o in waiting])
+        self.assertEqual(Order.objects.filter(status=Order.OrderStatus.IN_TRANSIT).count(), 3)
+        self.assertEqual(OrderEvent.objects.count(), 3)
+
+    def test_anonymous_completion_is_refused(self):
+        order = self.make_order(status=Order.OrderStatus.IN_TRANSIT)
+        response = self.client.post(reverse('core:complete_delivery'), {'order_id': order.id})
+        self.assertEqual(response.status_code, 401)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.OrderStatus.IN_TRANSIT)
+        self.assertFalse(OrderEvent.objects.exists())
+
+    def test_completing_an_order_that_never_started_is_a_conflict(self):
+        order = self.make_order()
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('core:complete_delivery'), {'order_id': order.id})
+        self.assertEqual(response.status_code, 409)
+        self.client.post(reverse('core:start_drone'), {'order_id': order.id})
+        with self.assertLogs('core.events') as logs, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('core:complete_delivery'), {'order_id': order.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([record.event.name for record in logs.records], ['delivery_completed'])
+
+
+class OrderArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('gus', password='pw')
+        restaurant = Restaurant.objects.create(name='KFC')
+        item = MenuItem.objects.create(name='Bucket', price=5, restaurant=restaurant)
+        now = timezone.now()
+        for days, status in [(400, 'completed'), (300, 'completed'), (20, 'in_transit'), (1, 'completed')]:
+            order = Order.objects.create(user=cls.user, restaurant=restaurant, total_price=5, status=status,
+                                         delivery_latitude=43.2, delivery_longitude=76.6,
+                                         created_at=now - timedelta(days=days))
+            OrderItem.objects.create(order=order, menu_item=item, quantity=2, price_at_time=5)
+            OrderEvent.objects.create(order=order, from_status='created', to_status='in_transit')
+
+    def test_only_old_completed_orders_move_in_batches(self):
+        call_command('archive_orders', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+        self.assertEqual(ArchivedOrderItem.objects.count(), 2)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertFalse(OrderItem.objects.filter(order_id__in=ArchivedOrder.objects.values('id')).exists())
+        # История переходов остаётся доступной по id заказа
+        self.assertEqual(OrderEvent.objects.count(), 4)
+
+    def test_history_merges_hot_and_archived_orders(self):
+        expected = list(Order.objects.order_by('-created_at').values_list('id', flat=True))
+        archive.archive()
+        pages, cursor = [], None
+        while True:
+            page = order_history(self.user, cursor=cursor, limit=1)
+            pages.extend(order.id for order in page.orders)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(pages, expected)
+        self.assertEqual(page.orders[0].items.all()[0].quantity, 2)
+
+    def test_recent_history_page_does_not_query_the_archive(self):
+        archive.archive()
+        with self.assertNumQueries(2):
+            page = order_history(self.user, limit=1)
+        self.assertIsNotNone(page.next_cursor)
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('hana', password='pw', is_staff=True)
+        kfc, salam = Restaurant.objects.create(name='KFC'), Restaurant.objects.create(name='Salam')
+        cls.kfc = kfc
+        now = timezone.now()
+        for n, (restaurant, status) in enumerate([(kfc, 'completed'), (kfc, 'created'), (salam, 'completed')]):
+            order = Order.objects.create(user=cls.staff, restaurant=restaurant, total_price=10, status=status,
+                                         delivery_latitude=43.2, delivery_longitude=76.6,
+                                         created_at=now - timedelta(days=200 * n))
+            item = MenuItem.objects.create(name=f'Dish, "{n}"', price=5, restaurant=restaurant)
+            OrderItem.objects.create(order=order, menu_item=item, quantity=2, price_at_time=5)
+        archive.archive()
+
+    def test_csv_export_streams_hot_and_archived_rows(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('core:export_orders'), {'dataset': 'items'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(lines[0][:4], ['order_id', 'item_id', 'menu_item_id', 'menu_item'])
+        self.assertEqual(sorted(line[3] for line in lines[1:]), ['Dish, "0"', 'Dish, "1"', 'Dish, "2"'])
+
+    def test_filters_apply_to_both_sources(self):
+        chunks = export.stream('orders', 'jsonl', export.parse_filter({'restaurant': self.kfc.id,
+                                                                      'status': 'completed'}), chunk_size=1)
+        rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        self.assertEqual([(row['restaurant'], row['status']) for row in rows], [('KFC', 'completed')])
+
+        since = (timezone.now() - timedelta(days=300)).date().isoformat()
+        out = io.StringIO()
+        call_command('export_orders', format='jsonl', since=since, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+    def test_invalid_filters_and_non_staff_are_rejected(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('core:export_orders'), {'status': 'lost'})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_login(User.objects.create_user('ivan', password='pw'))
+        response = self.client.get(reverse('core:export_orders'))
+        self.assertEqual(response.status_code, 403)
+
+
+class AdminChangeListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('root', password='pw')
+        restaurant = Restaurant.objects.create(name='KFC')
+        items = [MenuItem.objects.create(name=f'Item {i}', price=5, restaurant=restaurant) for i in range(3)]
+        for n in range(3):
+            user = User.objects.create_user(f'user{n}', password='pw')
+            order = Order.objects.create(user=user, restaurant=restaurant, total_price=5,
+                                         delivery_latitude=43.2, delivery_longitude=76.6)
+            OrderItem.objects.bulk_create(OrderItem(order=order, menu_item=item, quantity=1, price_at_time=5)
+                                          for item in items)
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:core_{model}_changelist')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def test_rows_do_not_add_queries(self):
+        self.client.force_login(self.admin)
+        for model in ('order', 'orderitem', 'cartitem', 'menuitem'):
+            before = self.changelist_queries(model)
+            restaurant = Restaurant.objects.get()
+            order = Order.objects.create(user=User.objects.create_user(f'late-{model}'), restaurant=restaurant,
+                                         total_price=5, delivery_latitude=43.2, delivery_longitude=76.6)
+            item = MenuItem.objects.create(name=f'Late {model}', price=5, restaurant=restaurant)
+            OrderItem.objects.create(order=order, menu_item=item, quantity=1, price_at_time=5)
+            CartItem.objects.create(user=order.user, menu_item=item)
+            self.assertEqual(self.changelist_queries(model), before, model)
+
+    def test_status_filter_and_exact_count_below_threshold(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:core_order_changelist'), {'status__exact': 'created'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertEqual(response.context['cl'].paginator.count, 3)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('jack', password='pw')
+        kfc, salam = Restaurant.objects.create(name='KFC'), Restaurant.objects.create(name='Salam')
+        MenuItem.objects.create(name='Burger', description='Beef', price=5, restaurant=kfc)
+        MenuItem.objects.create(name='Wings', description='Spicy, goes well with a burger', price=4, restaurant=kfc)
+        MenuItem.objects.create(name='Бургер с говядиной', price=6, restaurant=salam)
+        MenuItem.objects.create(name='Plov', price=7, restaurant=salam)
+        for n in range(5):
+            Product.objects.create(name=f'Drone part {n}', price=10, owner=cls.user)
+        Product.objects.create(name='Sold drone', price=10, owner=cls.user, available=False)
+
+    def test_menu_search_ranks_name_matches_first_and_matches_prefixes(self):
+        response = self.client.get(reverse('core:search'), {'q': 'burg'})
+        names = [result['name'] for result in response.json()['results']]
+        self.assertEqual(names, ['Burger', 'Wings'])
+        response = self.client.get(reverse('core:search'), {'q': 'Бур'})
+        self.assertEqual(response.json()['results'][0]['restaurant'], 'Salam')
+
+    def test_product_search_requires_login(self):
+        params = {'q': 'drone', 'type': 'products'}
+        self.assertEqual(self.client.get(reverse('core:search'), params).status_code, 401)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:search'), params)
+        self.assertEqual(len(response.json()['results']), 5)
+
+    @skipUnless(connection.vendor == 'postgresql', 'search_vector columns exist on PostgreSQL only')
+    def test_postgres_prefix_tsquery_ranks_name_above_description(self):
+        with CaptureQueriesContext(connection) as queries:
+            page = search.menu_items('burg')
+        self.assertIn('to_tsquery', queries[0]['sql'])
+        self.assertEqual([item.name for item in page.results], ['Burger', 'Wings'])
+        self.assertEqual([item.name for item in search.menu_items('бур').results], ['Бургер с говядиной'])
+        self.assertEqual(len(search.products('drone part').results), 5)
+
+    def test_pages_have_no_count_query(self):
+        with self.assertNumQueries(1):
+            page = search.products('drone', page=2, page_size=2)
+        self.assertEqual(len(page.results), 2)
+        self.assertTrue(page.has_next)
+        self.assertFalse(search.products('drone', page=3, page_size=2).has_next)
+        self.assertEqual(self.client.get(reverse('core:search'), {'q': '  '}).status_code, 400)
+
+    def test_market_view_filters_products(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:market'), {'q': 'part 3'})
+        self.assertEqual([product.name for product in response.context['products']], ['Drone part 3'])
+
+
+class CatalogApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('kate', password='pw')
+        cls.restaurants = [Restaurant.objects.create(name=f'R{n}') for n in range(5)]
+        MenuItem.objects.create(name='Bucket', price=12, restaurant=cls.restaurants[0])
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['catalog_local'].clear()
+
+    def test_keyset_pages_with_field_selection(self):
+        url = reverse('core:api_restaurants')
+        first = self.client.get(url, {'limit': 2, 'fields': 'id,name'}).json()
+        self.assertEqual(first['results'], [{'id': r.id, 'name': r.name} for r in self.restaurants[:2]])
+        rest = self.client.get(url, {'after': first['next_after'], 'limit': 10}).json()
+        self.assertEqual([r['name'] for r in rest['results']], ['R2', 'R3', 'R4'])
+        self.assertIsNone(rest['next_after'])
+        self.assertEqual(self.client.get(url, {'fields': 'id,secret'}).status_code, 400)
+
+    def test_unchanged_page_is_304_without_queries(self):
+        url = reverse('core:api_menu', args=[self.restaurants[0].id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(response.json()['results'][0]['name'], 'Bucket')
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.create(name='Wings', price=4, restaurant=self.restaurants[0])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(reverse('core:api_menu', args=[999])).status_code, 404)
+
+    def test_stale_page_during_rebuild_keeps_its_own_etag(self):
+        url = reverse('core:api_restaurants')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Restaurant.objects.create(name='R5')
+        # Другой процесс держит блокировку пересборки новой версии
+        version = catalog.get_version(catalog.RESTAURANTS)
+        caches['default'].add(f'catalog:{catalog.RESTAURANTS}:v{version}:lock', 1)
+        caches['catalog_local'].clear()
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        caches['default'].delete(f'catalog:{catalog.RESTAURANTS}:v{version}:lock')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 6)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_wildcard_if_none_match_requires_existing_resource(self):
+        self.assertEqual(self.client.get(reverse('core:api_menu', args=[999]), HTTP_IF_NONE_MATCH='*').status_code, 404)
+        url = reverse('core:api_menu', args=[self.restaurants[0].id])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='*').status_code, 304)
+
+    def test_products_require_login_and_change_etag_on_purchase(self):
+        url = reverse('core:api_products')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        product = Product.objects.create(name='Drone', price=10, owner=self.user)
+        buyer = User.objects.create_user('leo', password='pw')
+        self.client.force_login(buyer)
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertFalse([q for q in queries if Product._meta.db_table in q['sql']])
+        with self.captureOnCommitCallbacks(execute=True):
+            market.buy(buyer, product)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'core'
 
@@ -16,10 +16,17 @@ urlpatterns = [
     path('observe/', views.observe, name='observe'),
     path('submit_order/', views.submit_order, name='submit_order'),
     path('get_positions/', views.get_positions, name='get_positions'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('telemetry/ingest/', views.ingest_telemetry, name='ingest_telemetry'),
     path('calculate_eta/', views.calculate_eta, name='calculate_eta'),
+    path('calculate_eta/batch/', views.calculate_eta_batch, name='calculate_eta_batch'),
     path('create_order/', views.create_order, name='create_order'),
     path('start_drone/', views.start_drone, name='start_drone'),
     path('complete_delivery/', views.complete_delivery, name='complete_delivery'),
+    path('dispatch/', views.DispatchOrdersView.as_view(), name='dispatch_orders'),
+    path('export/orders/', views.OrderExportView.as_view(), name='export_orders'),
+    path('routes/plan/', views.RoutePlanView.as_view(), name='route_plan'),
+    path('search/', views.search_view, name='search'),
     path('restaurants/', views.RestaurantsView.as_view(), name='restaurants'),
     path('restaurant/<int:restaurant_id>/', views.RestaurantMenuView.as_view(), name='restaurant_menu'),
     path('cart/', views.CartView.as_view(), name='cart'),
@@ -29,4 +36,9 @@ urlpatterns = [
     path('checkout/', views.CheckoutView.as_view(), name='checkout'),
     path('order_confirmation/<int:order_id>/', views.OrderConfirmationView.as_view(), name='order_confirmation'),
     path('orders/', views.OrdersView.as_view(), name='orders'),
+
+    path('api/restaurants/', api.catalog_view, {'resource_name': 'restaurants'}, name='api_restaurants'),
+    path('api/restaurants/<int:restaurant_id>/menu/', api.catalog_view, {'resource_name': 'menu'},
+         name='api_menu'),
+    path('api/products/', api.catalog_view, {'resource_name': 'products'}, name='api_products'),
 ]
\ No newline at end of file
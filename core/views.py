@@ -1,20 +1,44 @@
+import json
+import logging
+
 from django.shortcuts import render, redirect, get_object_or_404, reverse
 from django.contrib.auth.views import LoginView, LogoutView
 from django.views.generic import ListView, CreateView, View, FormView, TemplateView
 from django.contrib.auth.forms import UserCreationForm  # Django's built-in form
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, Http404, StreamingHttpResponse
 from django.conf import settings
+from django.core.exceptions import PermissionDenied
 from django.contrib.auth import logout
-from .models import User, Product, Restaurant, MenuItem, CartItem, Order, OrderItem
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.views.static import serve
+from .models import User, Product, Restaurant, MenuItem, CartItem, Order, ArchivedOrder
 from .forms import ProductForm, CartItemForm, UpdateCartItemForm, OrderForm, CustomUserCreationForm
+from . import cart, catalog, eta, events, export, geo, lifecycle, market, metrics, search, storage, telemetry
+from .dispatch import dispatcher
+from .routes import plan_missions
+from .streaming import order_stream_token
+from .orders import order_history, place_order, InvalidCursor, EmptyCartError
+
+logger = logging.getLogger(__name__)
 
 
 class HomeView(TemplateView):
     template_name = 'core/home.html'
 
 
+def _page_number(request):
+    try:
+        return max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        return 1
+
+
 class MarketView(LoginRequiredMixin, ListView):
     model = Product
     template_name = 'core/market.html'
@@ -22,7 +46,16 @@ class MarketView(LoginRequiredMixin, ListView):
     login_url = 'core:login'  # Django's way to redirect if not logged in
 
     def get_queryset(self):
-        return Product.objects.filter(available=True)
+        self.query = self.request.GET.get('q', '')
+        self.page = search.products(self.query, page=_page_number(self.request))
+        return self.page.results
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['pending_credit'] = market.pending_credit(self.request.user)
+        context['query'] = self.query
+        context['page'] = self.page
+        return context
 
 
 class ProductCreateView(LoginRequiredMixin, CreateView):
@@ -109,163 +142,307 @@ def admin_panel(request):
 class BuyProductView(LoginRequiredMixin, View):
     def get(self, request, product_id):
         product = get_object_or_404(Product, id=product_id)
-        if product.owner == request.user:
+        try:
+            market.buy(request.user, product)
+        except market.OwnProduct:
             messages.error(request, "You can't buy your own product!")
-        elif not product.available:
+        except market.ProductUnavailable:
             messages.error(request, 'This product is no longer available.')
-        elif request.user.budget < product.price:
+        except market.InsufficientFunds:
             messages.error(request, 'Not enough money to buy this product!')
         else:
-            request.user.budget -= product.price
-            product.owner.budget += product.price
-            product.owner = request.user
-            request.user.save()
-            product.owner.save()
             messages.success(request, 'Successfully purchased product!')
             return redirect('core:observe')
         return redirect('core:market')
 
 
 def observe(request):
-    return render(request, 'core/observe.html')
+    context = {'stream_url': settings.POSITIONS_STREAM_PATH}
+    order_id = request.GET.get('order')
+    if order_id and order_id.isdigit() and request.user.is_authenticated and \
+            Order.objects.filter(id=order_id, user=request.user).exists():
+        context['stream_url'] += '?order=' + order_stream_token(int(order_id))
+    return render(request, 'core/observe.html', context)
 
 
 def submit_order(request):
-    # Тут можно сохранить заказ, например в базу или лог
-    first_name = request.POST.get('firstName')
-    last_name = request.POST.get('lastName')
-    phone_number = request.POST.get('phoneNumber')
+    # Имя и телефон (firstName, lastName, phoneNumber) в журнал не пишем
     restaurant = request.POST.get('restaurant')
-    print(f"Order from {first_name} {last_name} ({phone_number}) for {restaurant}")
+    events.emit(events.OrderSubmitted(restaurant))
 
     return JsonResponse({'redirect_url': reverse('core:observe')})
 
 
+def search_view(request):
+    """``?q=...&type=menu|products&page=N``: ranked JSON results, prefix matching."""
+    kind = request.GET.get('type', 'menu')
+    if kind not in ('menu', 'products'):
+        return JsonResponse({'error': "type must be 'menu' or 'products'"}, status=400)
+    if kind == 'products' and not request.user.is_authenticated:
+        # Товары с именами продавцов, как и на странице рынка, только для вошедших
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    query = request.GET.get('q', '')
+    if not search.terms(query):
+        return JsonResponse({'error': 'Query is required'}, status=400)
+    page_size = request.GET.get('page_size')
+    page_size = int(page_size) if page_size and page_size.isdigit() else None
+    if kind == 'menu':
+        page = search.menu_items(query, _page_number(request), page_size)
+        results = [
+            {'id': item.id, 'name': item.name, 'description': item.description, 'price': item.price,
+             'restaurant_id': item.restaurant_id, 'restaurant': item.restaurant.name,
+             'url': reverse('core:restaurant_menu', args=[item.restaurant_id])}
+            for item in page.results
+        ]
+    else:
+        page = search.products(query, _page_number(request), page_size)
+        results = [
+            {'id': product.id, 'name': product.name, 'description': product.description,
+             'price': product.price, 'owner': product.owner.username}
+            for product in page.results
+        ]
+    return JsonResponse({
+        'results': results,
+        'page': page.page,
+        'next_page': page.page + 1 if page.has_next else None,
+    })
+
+
+@csrf_exempt
+@require_POST
+def ingest_telemetry(request):
+    token = settings.TELEMETRY_INGEST_TOKEN
+    if not token and not settings.DEBUG:
+        # Без токена любой мог бы подделать позиции, по которым работает диспетчер
+        return JsonResponse({'error': 'Telemetry ingest is disabled: TELEMETRY_INGEST_TOKEN is not set'},
+                            status=403)
+    if token and not constant_time_compare(request.headers.get('X-Telemetry-Token', ''), token):
+        return JsonResponse({'error': 'Invalid telemetry token'}, status=403)
+    try:
+        reports = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    if isinstance(reports, dict):
+        reports = reports.get('reports', [])
+    if not isinstance(reports, list):
+        return JsonResponse({'error': 'Expected a list of reports'}, status=400)
+
+    accepted, rejected = telemetry.store.ingest(reports)
+    return JsonResponse({'accepted': accepted, 'rejected': rejected})
+
+
 def get_positions(request):
-    # Это пример. Ты можешь получать данные из модели, БД или модуля.
-    drone_data = [{
-        "id": "DRONE_001",
-        "battery": 85,
-        "weather": "Ясно",
-        "temp": 22,
-        "humidity": 40,
-        "wind_speed": 3,
-        "gps": [43.1965135, 76.6309754]
-    }]
-    return JsonResponse(drone_data)
+    # Отдаём последнее состояние дронов из памяти, без обращения к БД
+    return JsonResponse(telemetry.store.snapshot(), safe=False)
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if not request.user.is_staff:
+        if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+        if not token and not settings.DEBUG:
+            # Имена view и объёмы запросов не для всех: без токена — только персонал
+            return HttpResponse('METRICS_TOKEN is not set', status=403, content_type='text/plain')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 def calculate_eta(request):
     try:
         lat = float(request.POST.get('lat'))
         lon = float(request.POST.get('lon'))
-        # Сюда добавь реальную логику расчета
-        eta = 5.3  # в минутах
-        return JsonResponse({"eta": eta})
-    except Exception as e:
-        return JsonResponse({"error": "Ошибка при расчете ETA"}), 400
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Ошибка при расчете ETA"}, status=400)
+    if not geo.is_valid_point(lat, lon):
+        return JsonResponse({"error": "Координаты вне допустимого диапазона"}, status=400)
 
+    drone_id, minutes = eta.best_eta((lat, lon))
+    return JsonResponse({"eta": minutes, "drone_id": drone_id})
 
-def create_order(request):
+
+@require_POST
+def calculate_eta_batch(request):
+    """ETA matrix in minutes; ``origins`` defaults to the current fleet."""
     try:
-        lat = float(request.POST.get('lat'))
-        lon = float(request.POST.get('lon'))
+        payload = json.loads(request.body)
+        destinations = [(float(lat), float(lon)) for lat, lon in payload['destinations']]
+        if 'origins' in payload:
+            drone_ids = None
+            origins = [(float(lat), float(lon)) for lat, lon in payload['origins']]
+        else:
+            drone_ids, origins = eta.fleet_positions()
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({"error": "Expected {'destinations': [[lat, lon], ...]}"}, status=400)
+    if not all(geo.is_valid_point(lat, lon) for lat, lon in [*origins, *destinations]):
+        return JsonResponse({"error": "Coordinates out of range"}, status=400)
+    if len(origins) * len(destinations) > settings.ETA_BATCH_MAX_PAIRS:
+        return JsonResponse({"error": "Too many pairs"}, status=400)
 
-        # Получаем товары из корзины
-        cart_items = CartItem.objects.filter(user=request.user).all()
-        if not cart_items:
-            return JsonResponse({"error": "Your cart is empty!"}), 400
-
-        # Создаем заказ
-        restaurant = cart_items[0].menu_item.restaurant
-        total = sum(item.menu_item.price * item.quantity for item in cart_items)
-
-        order = Order(
-            user=request.user,
-            restaurant=restaurant,
-            total_price=total,
-            delivery_latitude=lat,
-            delivery_longitude=lon,
-            status='created'
-        )
-        order.save()
-
-        # Создаем элементы заказа
-        for cart_item in cart_items:
-            order_item = OrderItem(
-                order=order,
-                menu_item=cart_item.menu_item,
-                quantity=cart_item.quantity,
-                price_at_time=cart_item.menu_item.price
-            )
-            order_item.save()
+    minutes = eta.eta_matrix(origins, destinations)
+    if hasattr(minutes, 'tolist'):
+        minutes = minutes.tolist()
+    return JsonResponse({"drone_ids": drone_ids, "eta": minutes})
 
-        # Очищаем корзину
-        CartItem.objects.filter(user=request.user).delete()
 
-        print(f"Order created: {order.id}")
+def create_order(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    try:
+        lat = float(request.POST.get('lat'))
+        lon = float(request.POST.get('lon'))
+        order = place_order(request.user, lat, lon)
         return JsonResponse({"order_id": order.id})
-    except Exception as e:
-        print(f"Error creating order: {str(e)}")
-        return JsonResponse({"error": "Error creating order"}), 500
+    except EmptyCartError:
+        return JsonResponse({"error": "Your cart is empty!"}, status=400)
+    except Exception:
+        logger.exception('Error creating order')
+        return JsonResponse({"error": "Error creating order"}, status=500)
 
 
 def start_drone(request):
     try:
-        lat = float(request.POST.get('lat'))
-        lon = float(request.POST.get('lon'))
         order_id = int(request.POST.get('order_id'))
+        order = Order.objects.filter(id=order_id).only(
+            'user_id', 'status', 'drone_id', 'delivery_latitude', 'delivery_longitude').first()
+        if not order:
+            return JsonResponse({"error": "Order not found"}, status=404)
+
+        if order.user_id != request.user.id:
+            return JsonResponse({"error": "Access denied"}, status=403)
+        if order.status != Order.OrderStatus.CREATED:
+            return JsonResponse({"error": f"Order is already {order.status}"}, status=409)
+
+        # Пока ни один дрон не прислал телеметрию, работаем без назначения
+        drone_id = order.drone_id
+        reserved = None
+        if telemetry.store.drones():
+            current = telemetry.store.get(drone_id) if drone_id else None
+            # Дрон, назначенный пакетным диспетчером, уже зарезервирован за этим заказом
+            if current is None or current.order_id != order.id:
+                assignments = dispatcher.assign([(order.id, order.delivery_latitude, order.delivery_longitude)])
+                if not assignments:
+                    return JsonResponse({"error": "Нет свободных дронов с достаточным зарядом"}, status=409)
+                drone_id = reserved = assignments[0].drone_id
+
+        try:
+            lifecycle.transition(order.id, Order.OrderStatus.IN_TRANSIT, user=request.user, drone_id=drone_id)
+        except Exception:
+            if reserved:
+                telemetry.store.release(reserved, order.id)
+            raise
+        return JsonResponse({"status": "ok", "drone_id": drone_id})
+    except lifecycle.IllegalTransition as e:
+        # Параллельный запрос успел запустить этот заказ
+        return JsonResponse({"error": f"Order is already {e.current}"}, status=409)
+    except Exception:
+        logger.exception('Error starting drone')
+        return JsonResponse({"error": "Error starting drone"}, status=500)
+
+
+class DispatchOrdersView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Assign drones to the oldest undispatched orders in one batch."""
+    login_url = 'core:login'
 
-        # Проверяем батарею
-        battery_level = 85
-        if battery_level < 20:
-            return JsonResponse({"error": "Батарея слишком низкая"}), 400
+    def post(self, request):
+        with transaction.atomic():
+            # skip_locked: заказы, которые сейчас назначает другой запрос или симулятор, достанутся ему
+            orders = list(
+                Order.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=Order.OrderStatus.CREATED, drone_id='')
+                .order_by('created_at')
+                .only('id', 'delivery_latitude', 'delivery_longitude')[:settings.DISPATCH_BATCH_SIZE]
+            )
+            assignments = dispatcher.assign(
+                [(order.id, order.delivery_latitude, order.delivery_longitude) for order in orders]
+            )
+            try:
+                drones = {a.order_id: a.drone_id for a in assignments}
+                for order in orders:
+                    order.drone_id = drones.get(order.id, '')
+                Order.objects.bulk_update([o for o in orders if o.drone_id], ['drone_id'], batch_size=500)
+            except Exception:
+                for a in assignments:
+                    telemetry.store.release(a.drone_id, a.order_id)
+                raise
+        return JsonResponse({
+            'assigned': [a._asdict() for a in assignments],
+            'unassigned': [o.id for o in orders if not o.drone_id],
+        })
+
+    def test_func(self):
+        return self.request.user.is_staff
 
-        # Обновляем статус заказа
-        order = Order.objects.get(id=order_id)
-        if not order:
-            return JsonResponse({"error": "Order not found"}), 404
 
-        if order.user != request.user:
-            return JsonResponse({"error": "Access denied"}), 403
+class OrderExportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Stream orders or order items as CSV or JSON lines (staff only).
 
-        order.status = 'in_transit'
-        order.save()
-        print(f"Order {order.id} status updated to in_transit")
+    ``?dataset=orders|items&format=csv|jsonl&restaurant=&status=&since=&until=``
+    """
+    login_url = 'core:login'
 
-        return JsonResponse({"status": "ok"})
-    except Exception as e:
-        print(f"Error starting drone: {str(e)}")
-        return JsonResponse({"error": "Error starting drone"}), 500
+    def get(self, request):
+        dataset = request.GET.get('dataset', 'orders')
+        fmt = request.GET.get('format', 'csv')
+        try:
+            chunks = export.stream(dataset, fmt, export.parse_filter(request.GET))
+        except export.InvalidExport as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        response = StreamingHttpResponse(chunks, content_type=export.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+        return response
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+
+class RoutePlanView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Multi-drop missions for the orders that are still waiting for a drone."""
+    login_url = 'core:login'
+
+    def get(self, request):
+        missions, unservable = plan_missions()
+        return JsonResponse({
+            'missions': [
+                {
+                    'restaurant_id': mission.restaurant_id,
+                    'stops': [stop._asdict() for stop in mission.stops],
+                    'distance': round(mission.distance, 1),
+                }
+                for mission in missions
+            ],
+            'unservable': unservable,
+        })
+
+    def test_func(self):
+        return self.request.user.is_staff
 
 
 def complete_delivery(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
     try:
         order_id = request.POST.get('order_id')
         if not order_id:
-            print("No order_id provided in request")
-            return JsonResponse({'error': 'Order ID is required'}), 400
+            return JsonResponse({'error': 'Order ID is required'}, status=400)
 
+        # Одно условное UPDATE: чужой заказ или заказ не в пути не изменится
         order_id = int(order_id)
-        order = Order.objects.get(id=order_id)
-
-        # Проверяем, что заказ принадлежит текущему пользователю
-        if order.user != request.user:
-            return JsonResponse({'error': 'Access denied'}), 403
-
-        # Обновляем статус заказа
-        order.status = 'completed'
-        order.save()
-
-        print(f"Order {order_id} marked as completed")
+        lifecycle.transition(order_id, Order.OrderStatus.COMPLETED, user=request.user)
+        telemetry.store.release_orders([order_id])
         return JsonResponse({'success': True})
 
     except ValueError:
-        print(f"Error completing delivery: invalid order_id format")
-        return JsonResponse({'error': 'Invalid order ID format'}), 400
-    except Exception as e:
-        print(f"Error completing delivery: {str(e)}")
-        return JsonResponse({'error': 'Internal server error'}), 500
+        return JsonResponse({'error': 'Invalid order ID format'}, status=400)
+    except Order.DoesNotExist:
+        return JsonResponse({'error': 'Order not found'}, status=404)
+    except PermissionDenied:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    except lifecycle.IllegalTransition as e:
+        return JsonResponse({'error': f'Order is {e.current}, not in transit'}, status=409)
+    except Exception:
+        logger.exception('Error completing delivery')
+        return JsonResponse({'error': 'Internal server error'}, status=500)
 
 
 class RestaurantsView(ListView):
@@ -273,6 +450,17 @@ class RestaurantsView(ListView):
     template_name = 'core/restaurants.html'
     context_object_name = 'restaurants'
 
+    def get_queryset(self):
+        # Версия, для которой собраны данные: во время чужой пересборки это прежняя версия,
+        # и старая сетка не закэшируется под ключом новой
+        restaurants, self.catalog_version = catalog.restaurants(with_version=True)
+        return restaurants
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['catalog_version'] = self.catalog_version
+        return context
+
 
 class RestaurantMenuView(ListView):
     model = MenuItem
@@ -281,13 +469,18 @@ class RestaurantMenuView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['restaurant'] = get_object_or_404(Restaurant, id=self.kwargs['restaurant_id'])
+        context['restaurant'] = self.restaurant
         context['form'] = CartItemForm()
+        context['catalog_version'] = self.catalog_version
         return context
 
     def get_queryset(self):
-        self.restaurant = get_object_or_404(Restaurant, id=self.kwargs['restaurant_id'])
-        return MenuItem.objects.filter(restaurant=self.restaurant)
+        restaurant_id = self.kwargs['restaurant_id']
+        menu, self.catalog_version = catalog.restaurant_menu(restaurant_id, with_version=True)
+        if menu is None:
+            raise Http404('No Restaurant matches the given query.')
+        self.restaurant, menu_items = menu
+        return menu_items
 
 
 class CartView(LoginRequiredMixin, ListView):
@@ -298,16 +491,13 @@ class CartView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart_items = self.get_queryset()
-        
-        # Calculate total
-        total = sum(item.menu_item.price * item.quantity for item in cart_items)
-        context['total'] = total
+        # Итог приходит в каждой строке из того же запроса
+        context['total'] = self.object_list[0].cart_total if self.object_list else 0
         context['update_form'] = UpdateCartItemForm()
         return context
 
     def get_queryset(self):
-        return CartItem.objects.filter(user=self.request.user)
+        return list(cart.lines(self.request.user))
 
 
 class AddToCartView(LoginRequiredMixin, View):
@@ -319,23 +509,8 @@ class AddToCartView(LoginRequiredMixin, View):
 
         form = CartItemForm(request.POST)
         if form.is_valid():
-            menu_item = get_object_or_404(MenuItem, id=form.cleaned_data['menu_item_id'])
-            existing_item = CartItem.objects.filter(
-                user=request.user,
-                menu_item=menu_item
-            ).first()
-
-            if existing_item:
-                existing_item.quantity += form.cleaned_data['quantity']
-                existing_item.save()
-            else:
-                cart_item = CartItem(
-                    user=request.user,
-                    menu_item=menu_item,
-                    quantity=form.cleaned_data['quantity']
-                )
-                cart_item.save()
-
+            if not cart.add_item(request.user, form.cleaned_data['menu_item_id'], form.cleaned_data['quantity']):
+                raise Http404('No MenuItem matches the given query.')
             messages.success(request, 'Item added to cart!')
         return redirect('core:cart')
 
@@ -344,9 +519,8 @@ class UpdateCartView(LoginRequiredMixin, View):
     def post(self, request, cart_item_id):
         form = UpdateCartItemForm(request.POST)
         if form.is_valid():
-            cart_item = get_object_or_404(CartItem, id=cart_item_id, user=request.user)
-            cart_item.quantity = form.cleaned_data['quantity']
-            cart_item.save()
+            if not cart.update_item(request.user, cart_item_id, form.cleaned_data['quantity']):
+                raise Http404('No CartItem matches the given query.')
             messages.success(request, 'Cart updated!')
         return redirect('core:cart')
     login_url = 'core:login'
@@ -354,8 +528,8 @@ class UpdateCartView(LoginRequiredMixin, View):
 
 class RemoveFromCartView(LoginRequiredMixin, View):
     def get(self, request, cart_item_id):
-        cart_item = get_object_or_404(CartItem, id=cart_item_id, user=request.user)
-        cart_item.delete()
+        if not cart.remove_item(request.user, cart_item_id):
+            raise Http404('No CartItem matches the given query.')
         messages.success(request, 'Item removed from cart!')
         return redirect('core:cart')
     login_url = 'core:login'
@@ -368,58 +542,30 @@ class CheckoutView(LoginRequiredMixin, FormView):
     login_url = 'core:login'
 
     def get(self, request, *args, **kwargs):
-        cart_items = CartItem.objects.filter(user=request.user)
-        if not cart_items:
+        self.cart = cart.summary(request.user)
+        if not self.cart[0]:
             messages.warning(request, 'Your cart is empty!')
             return redirect('core:cart')
         return super().get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart_items = CartItem.objects.filter(user=self.request.user)
-        
-        # Calculate subtotal for each item and total
-        total = 0
-        for item in cart_items:
-            item.subtotal = item.menu_item.price * item.quantity
-            total += item.subtotal
-            
-        context['cart_items'] = cart_items
-        context['total'] = total
+        if not hasattr(self, 'cart'):
+            self.cart = cart.summary(self.request.user)
+        context['cart_items'], context['total'] = self.cart
         return context
 
     def form_valid(self, form):
-        cart_items = CartItem.objects.filter(user=self.request.user)
-        if not cart_items:
+        try:
+            order = place_order(
+                self.request.user,
+                form.cleaned_data['delivery_latitude'],
+                form.cleaned_data['delivery_longitude'],
+            )
+        except EmptyCartError:
             messages.warning(self.request, 'Your cart is empty!')
             return redirect('core:cart')
 
-        # Create order
-        restaurant = cart_items[0].menu_item.restaurant
-        total = sum(item.menu_item.price * item.quantity for item in cart_items)
-
-        order = Order(
-            user=self.request.user,
-            restaurant=restaurant,
-            total_price=total,
-            delivery_latitude=form.cleaned_data['delivery_latitude'],
-            delivery_longitude=form.cleaned_data['delivery_longitude']
-        )
-        order.save()
-
-        # Create order items
-        for cart_item in cart_items:
-            order_item = OrderItem(
-                order=order,
-                menu_item=cart_item.menu_item,
-                quantity=cart_item.quantity,
-                price_at_time=cart_item.menu_item.price
-            )
-            order_item.save()
-
-        # Clear cart
-        CartItem.objects.filter(user=self.request.user).delete()
-
         messages.success(self.request, 'Order placed successfully!')
         return redirect(reverse('core:order_confirmation', kwargs={'order_id': order.id}))
 
@@ -431,7 +577,11 @@ class OrderConfirmationView(LoginRequiredMixin, ListView):
     login_url = 'core:login'
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user, id=self.kwargs['order_id'])
+        orders = Order.objects.filter(user=self.request.user, id=self.kwargs['order_id'])
+        if not orders:
+            # Старый выполненный заказ мог уехать в архив
+            orders = ArchivedOrder.objects.filter(user=self.request.user, id=self.kwargs['order_id'])
+        return orders
 
 
 class OrdersView(LoginRequiredMixin, ListView):
@@ -441,7 +591,16 @@ class OrdersView(LoginRequiredMixin, ListView):
     login_url = 'core:login'
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        try:
+            self.page = order_history(self.request.user, cursor=self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Invalid cursor')
+        return self.page.orders
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.page.next_cursor
+        return context
 
 
 class CustomLogoutView(View):
@@ -454,3 +613,13 @@ class CustomLogoutView(View):
         logout(request)
         messages.success(request, 'You have been successfully logged out!')
         return redirect('core:home')
+
+
+def serve_media(request, path):
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if storage.is_hashed(path):
+        # Имя по хэшу содержимого: файл под этим адресом никогда не изменится
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=3600)
+    return response
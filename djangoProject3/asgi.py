@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoProject3.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from core.streaming import positions_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Поток позиций обслуживается до Django, без middleware
+    if scope['type'] == 'http' and scope['path'] == settings.POSITIONS_STREAM_PATH:
+        return await positions_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -42,6 +42,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.staticfiles.StaticFilesMiddleware',
+    'core.metrics.RequestMetricsMiddleware',
+    'core.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -63,6 +66,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.catalog',
             ],
         },
     },
@@ -85,6 +89,53 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: DATABASE_REPLICA_HOSTS=host1,host2:5433
+DATABASE_REPLICAS = []
+for _index, _host in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',')), 1):
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[f'replica{_index}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{_index}')
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+REPLICA_MAX_LAG = 5  # секунды; реплика с большим отставанием пропускается
+REPLICA_LAG_CHECK_INTERVAL = 5  # секунды между проверками отставания
+REPLICA_PIN_SECONDS = 10  # после записи клиент читает с основной базы
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    # Общий для всех процессов кэш; без REDIS_URL — память процесса (разработка)
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    } if os.environ.get('REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog_local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+    # {% cache %} в шаблонах каталога: ключи содержат версию каталога, срок жизни CATALOG_TTL
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
+CATALOG_TTL = 600  # мягкий TTL записи каталога, секунды
+CATALOG_LOCAL_TTL = 60
+CATALOG_VERSION_TTL = 2  # как долго процесс доверяет своей копии номера версии
+CATALOG_VERSION_KEY_TTL = 60 * 60 * 24  # ключ версии в общем кэше; после истечения версия продолжится с отметки времени
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -125,9 +176,22 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+STATIC_IMAGE_MAX_BYTES = 200 * 1024  # картинки тяжелее пережимаются при collectstatic
+STATIC_IMAGE_MAX_DIMENSION = 1600
+STATIC_CACHE_MAX_AGE = 60 * 60 * 24 * 365
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_VARIANT_WIDTHS = (320, 640, 1024)  # уменьшенные копии для srcset
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365  # serve_media под DEBUG; в продакшене то же задаёт веб-сервер
+MEDIA_VARIANTS_TTL = 600  # сколько процесс помнит найденные варианты картинки, секунды
+
+STORAGES = {
+    # Загрузки хранятся под хэшем содержимого, см. core/storage.py
+    'default': {'BACKEND': 'core.storage.ContentAddressedStorage'},
+    # collectstatic: имена с хэшем, .gz/.br и пережатые картинки, см. core/staticfiles.py
+    'staticfiles': {'BACKEND': 'core.staticfiles.CompressedManifestStaticFilesStorage'},
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -136,3 +200,72 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Custom user model
 AUTH_USER_MODEL = 'core.User'
+
+# Drone fleet
+DRONE_BASE = (43.1965135, 76.6309754)  # база, откуда вылетают дроны
+DRONE_CRUISE_SPEED = 20.0  # м/с, 72 км/ч
+DRONE_ETA_OVERHEAD = 0.0  # секунды на взлёт и посадку
+ETA_BATCH_MAX_PAIRS = 1_000_000
+DISPATCH_CELL_SIZE = 0.01  # градусы, ~1 км
+DISPATCH_CANDIDATES = 5  # ближайших дронов на заказ
+DISPATCH_MIN_BATTERY = 20  # %
+DISPATCH_BATCH_SIZE = 1000
+ROUTE_WINDOW_MINUTES = 10  # заказы одного ресторана в этом окне летят вместе
+ROUTE_MAX_PAYLOAD = 6  # позиций на борту
+ROUTE_MAX_RANGE = 20_000  # метры за рейс, включая возврат
+
+# Drone telemetry
+TELEMETRY_HISTORY_SIZE = 32  # последние точки на дрон
+TELEMETRY_INGEST_TOKEN = os.environ.get('TELEMETRY_INGEST_TOKEN', '')  # обязателен при DEBUG = False
+POSITIONS_STREAM_PATH = '/stream/positions/'  # SSE, только под ASGI
+POSITIONS_STREAM_INTERVAL = 0.5  # секунды между рассылками
+POSITIONS_STREAM_HEARTBEAT = 15
+
+# Market
+MARKET_SETTLEMENT_BATCH = 1000  # записей журнала за транзакцию проведения
+
+# Orders archive and export (manage.py archive_orders, export_orders)
+# Увеличивать только после возврата заказов из архива: история не ищет в архиве заказы новее границы
+ORDER_ARCHIVE_AFTER_DAYS = 90
+ORDER_ARCHIVE_BATCH = 1000  # заказов за транзакцию
+EXPORT_CHUNK_SIZE = 2000  # строк за выборку курсора и за chunk ответа
+
+# Admin
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100_000  # выше — оценка планировщика PostgreSQL вместо COUNT(*)
+
+# Search (/search/, market)
+SEARCH_PAGE_SIZE = 24
+SEARCH_MAX_PAGE_SIZE = 100
+
+# JSON catalog API (/api/)
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Request metrics (/metrics/)
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '1.0'))  # в продакшене 0.05–0.1
+METRICS_DUPLICATE_THRESHOLD = 5  # столько одинаковых запросов за запрос — подозрение на N+1
+# Authorization: Bearer <token>; пусто — /metrics/ только для персонала (под DEBUG для всех)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Logging: события заказов и дронов пишутся в JSON lines фоновым потоком
+EVENT_LOG_PATH = os.environ.get('EVENT_LOG_PATH', str(BASE_DIR / 'logs' / 'events.jsonl'))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+        'events': {
+            'class': 'core.events.JsonLinesQueueHandler',
+            'path': EVENT_LOG_PATH,
+            'queue_size': 10_000,  # сверх этого записи отбрасываются, запрос не ждёт
+            'batch_size': 500,
+            'flush_interval': 1.0,
+            'overflow': 'drop_new',  # или 'drop_oldest'
+        },
+    },
+    'loggers': {
+        'core.events': {'handlers': ['events'], 'level': 'INFO', 'propagate': False},
+        # Ошибки приложения видны в консоли и попадают в журнал событий
+        'core': {'handlers': ['console', 'events'], 'level': 'WARNING', 'propagate': False},
+    },
+}
@@ -15,15 +15,23 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+import re
+
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import serve_media
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('core.urls', namespace='core')),  # Include core app URLs
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
-# Serve media files during development
+# Serve media files during development. In production MEDIA_ROOT is served by the
+# web server, which sends "Cache-Control: public, max-age=31536000, immutable"
+# for content-addressed names (see core/storage.py)
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += [
+        re_path(rf"^{re.escape(settings.MEDIA_URL.lstrip('/'))}(?P<path>.*)$", serve_media),
+    ]